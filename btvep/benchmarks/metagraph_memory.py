@@ -0,0 +1,110 @@
+"""
+Compares the memory held by a full bittensor.metagraph with the CompactMetagraph
+view that MetagraphSyncer keeps between syncs.
+
+By default a synthetic metagraph is built, so no network connection is needed:
+
+    python benchmarks/metagraph_memory.py --neurons 1024
+
+Pass --netuid to sync a real metagraph from the chain instead.
+"""
+import argparse
+import dataclasses
+import gc
+import random
+import tracemalloc
+
+import bittensor
+import torch
+
+from btvep.metagraph import CompactMetagraph, MetagraphIndex
+
+
+def synthetic_metagraph(netuid: int, n: int) -> bittensor.metagraph:
+    metagraph = bittensor.metagraph(netuid, sync=False)
+    null_neuron = bittensor.NeuronInfoLite._null_neuron()
+    metagraph.neurons = [
+        dataclasses.replace(
+            null_neuron,
+            uid=uid,
+            hotkey=bittensor.Keypair.create_from_seed(
+                random.randbytes(32)
+            ).ss58_address,
+            coldkey=bittensor.Keypair.create_from_seed(
+                random.randbytes(32)
+            ).ss58_address,
+            incentive=random.random(),
+            axon_info=bittensor.AxonInfo(
+                version=1,
+                ip=f"10.0.{uid // 256}.{uid % 256}" if uid % 4 else "0.0.0.0",
+                port=8091 if uid % 4 else 0,
+                ip_type=4,
+                hotkey="",
+                coldkey="",
+            ),
+        )
+        for uid in range(n)
+    ]
+    for neuron in metagraph.neurons:
+        neuron.axon_info.hotkey = neuron.hotkey
+        neuron.axon_info.coldkey = neuron.coldkey
+    metagraph._set_metagraph_attributes(block=1, subtensor=None)
+    return metagraph
+
+
+def tensor_bytes(metagraph: bittensor.metagraph) -> int:
+    return sum(
+        value.element_size() * value.nelement()
+        for value in vars(metagraph).values()
+        if isinstance(value, torch.Tensor)
+    ) + sum(
+        parameter.element_size() * parameter.nelement()
+        for parameter in metagraph.parameters()
+    )
+
+
+def measure(build):
+    """Bytes still allocated by build() once it returned, and its result."""
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    result = build()
+    gc.collect()
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return after - before, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--neurons", type=int, default=1024)
+    parser.add_argument("--netuid", type=int, help="Sync this subnet from the chain")
+    args = parser.parse_args()
+
+    if args.netuid is not None:
+        build_full = lambda: bittensor.subtensor().metagraph(netuid=args.netuid)
+        netuid = args.netuid
+    else:
+        build_full = lambda: synthetic_metagraph(1, args.neurons)
+        netuid = 1
+
+    # tracemalloc does not trace torch tensor storage, it is added separately
+    full_bytes, metagraph = measure(build_full)
+    full_bytes += tensor_bytes(metagraph)
+    del metagraph
+    # The full metagraph is released once the compact view is built, like in
+    # MetagraphSyncer.sync, so only what the compact view holds on to is counted
+    compact_bytes, compact = measure(
+        lambda: CompactMetagraph.from_metagraph(netuid, build_full())
+    )
+    index_bytes, _ = measure(lambda: MetagraphIndex(compact))
+
+    print(f"neurons:                {len(compact)}")
+    print(f"bittensor.metagraph:    {full_bytes / 1024:10.1f} KiB")
+    print(f"CompactMetagraph:       {compact_bytes / 1024:10.1f} KiB")
+    print(f"MetagraphIndex:         {index_bytes / 1024:10.1f} KiB")
+    print(f"saved per worker:       {(full_bytes - compact_bytes) / 1024:10.1f} KiB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+"""
+Compares the work done on the body of a large /chat request before and after
+it was parsed once per request (ParsedBody):
+
+- before: every log row serialized the messages again, once per miner response
+- after: the messages are serialized once and the string is reused for every row
+
+    python benchmarks/request_body.py --messages 500 --message-bytes 4000 --responses 10
+"""
+import argparse
+import json
+import timeit
+
+from pydantic import parse_obj_as
+
+from btvep.api.dependencies import ParsedBody
+from btvep.btvep_models import Message
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--messages", type=int, default=500)
+    parser.add_argument("--message-bytes", type=int, default=4000)
+    parser.add_argument("--responses", type=int, default=10)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    raw_body = json.dumps(
+        {
+            "messages": [
+                {
+                    "role": "user" if i % 2 == 0 else "assistant",
+                    "content": "x" * args.message_bytes,
+                }
+                for i in range(args.messages)
+            ],
+            "top_n": args.responses,
+        }
+    )
+    # Decoded and validated by FastAPI for the endpoint in both cases
+    body = json.loads(raw_body)
+    messages = parse_obj_as(list[Message], body["messages"])
+
+    def before():
+        # Moderation filter input
+        [message["content"] for message in body["messages"]]
+        # One log row per miner response
+        for _ in range(args.responses):
+            json.dumps([message.dict() for message in messages])
+
+    def after():
+        parsed_body = ParsedBody(body)
+        parsed_body.message_contents
+        for _ in range(args.responses):
+            parsed_body.prompt
+
+    print(f"body size:   {len(raw_body) / 1e6:.1f} MB")
+    print(f"responses:   {args.responses}")
+    for name, fn in [("before", before), ("after", after)]:
+        seconds = min(timeit.repeat(fn, number=1, repeat=args.repeat))
+        print(f"{name + ':':12} {seconds * 1000:8.2f} ms per request")
+
+
+if __name__ == "__main__":
+    main()
@@ -12,6 +12,7 @@ from btvep.api.admin import (
 from .api_keys import router as key_router
 from .conversation import router as conversation_router
 from .chat import router as chat_router
+from .health import router as health_router
 
 # Compose routers into a single router
 
@@ -35,5 +36,6 @@ all_endpoints.include_router(
     conversation_router, dependencies=[Depends(get_db), Depends(authenticate_user)]
 )
 all_endpoints.include_router(
-    chat_router, dependencies=[Depends(get_db), Depends(lambda: VerifyAPIKeyAndLimit())]
+    chat_router, dependencies=[Depends(get_db), Depends(VerifyAPIKeyAndLimit())]
 )
+all_endpoints.include_router(health_router, tags=["Health"])
@@ -4,6 +4,8 @@ from .api_keys import router as key_router
 from .logs import router as logs_router
 from .config import router as config_router
 from .rate_limits import router as ratelimit_router
+from .network import router as network_router
+from .moderation import router as moderation_router
 
 # Compose all routers into a single router
 router = APIRouter()
@@ -11,3 +13,5 @@ router.include_router(key_router, prefix="/api-keys")
 router.include_router(config_router, prefix="/config")
 router.include_router(logs_router, prefix="/logs")
 router.include_router(ratelimit_router, prefix="/rate-limits")
+router.include_router(network_router, prefix="/network")
+router.include_router(moderation_router, prefix="/moderation")
@@ -58,6 +58,7 @@ def edit_api_key(
     enabled: Optional[bool] = Body(None),
     rate_limits: Optional[List[RateLimitEntry]] = Body(None),
     rate_limits_enabled: Optional[bool] = Body(None),
+    response_cache_enabled: Optional[bool] = Body(None),
 ):
     """
     Edit an API key.
@@ -95,6 +96,7 @@ def edit_api_key(
         enabled=enabled,
         rate_limits=rate_limits,
         rate_limits_enabled=rate_limits_enabled,
+        response_cache_enabled=response_cache_enabled,
     )
     updated_key = api_keys.get(query)
     if updated_key is None:
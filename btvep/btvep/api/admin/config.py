@@ -37,6 +37,8 @@ async def set_config_value(config_value: ConfigValue):
     if key in config.__dict__:
         if isinstance(config.__dict__[key], bool):
             value = cast_str_to_bool(value)
+        elif isinstance(config.__dict__[key], int):
+            value = int(value)
         config.__dict__[key] = value
         try:
             config.validate(cli_mode=False)
@@ -0,0 +1,43 @@
+from typing import List, Literal
+
+from fastapi import APIRouter, HTTPException
+from pydantic import BaseModel
+
+from btvep.config import Config, config_snapshot
+
+router = APIRouter()
+
+ListName = Literal["blocklist", "allowlist"]
+
+
+class ModerationEntry(BaseModel):
+    value: str
+
+
+@router.get("/{list_name}", response_model=List[str])
+async def get_moderation_list(list_name: ListName):
+    config = config_snapshot.get()
+    return getattr(config, f"moderation_{list_name}")
+
+
+@router.post("/{list_name}")
+async def add_moderation_entry(list_name: ListName, entry: ModerationEntry):
+    if not entry.value.strip():
+        raise HTTPException(status_code=400, detail="Value can't be empty.")
+    config = Config().load()
+    entries = getattr(config, f"moderation_{list_name}")
+    if entry.value not in entries:
+        entries.append(entry.value)
+        config.save()
+    return {"status": f"Added to the {list_name}"}
+
+
+@router.delete("/{list_name}")
+async def delete_moderation_entry(list_name: ListName, index: int):
+    config = Config().load()
+    entries = getattr(config, f"moderation_{list_name}")
+    if index < 0 or index >= len(entries):
+        raise HTTPException(status_code=400, detail="Invalid index.")
+    entries.pop(index)
+    config.save()
+    return {"status": f"Deleted from the {list_name}"}
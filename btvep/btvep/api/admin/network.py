@@ -0,0 +1,26 @@
+from fastapi import APIRouter
+
+from btvep.validator_prompter import ValidatorPrompter
+
+router = APIRouter()
+
+
+@router.get("/stats")
+async def get_network_stats():
+    """
+    Stats on how the endpoint queries the bittensor network.
+    """
+    prompter = ValidatorPrompter()
+    return {
+        "abandoned_queries": prompter.abandoned_queries,
+        "recent_cancellations": list(prompter.recent_cancellations),
+        "uids": prompter.scoreboard.to_dict(),
+    }
+
+
+@router.get("/circuit-breakers")
+async def get_circuit_breakers():
+    """
+    Circuit breaker state per uid. Uids with an open breaker are skipped when querying the network.
+    """
+    return ValidatorPrompter().circuit_breakers.to_dict()
@@ -4,8 +4,9 @@ from typing import List, Optional
 from fastapi import APIRouter, Depends, HTTPException, Query
 from pydantic import BaseModel, Field
 
+from btvep.api.dependencies import rate_limiter_cache
 from btvep.btvep_models import RateLimitEntry
-from btvep.config import Config
+from btvep.config import Config, config_snapshot
 from btvep.db import api_keys
 
 router = APIRouter()
@@ -13,7 +14,7 @@ router = APIRouter()
 
 @router.get("/status")
 async def get_rate_limit_status():
-    config = Config().load()
+    config = config_snapshot.get()
     return {"rate_limiting_enabled": config.rate_limiting_enabled}
 
 
@@ -35,7 +36,7 @@ async def disable_rate_limiting():
 
 @router.get("/", response_model=List[RateLimitEntry])
 async def get_rate_limits(api_key: Optional[str] = None):
-    config = Config().load()
+    config = config_snapshot.get()
     if api_key:
         api_key = api_keys.get(api_key)
         if not api_key:
@@ -62,6 +63,7 @@ async def add_rate_limit(rate_limit: RateLimitEntry, api_key: Optional[str] = No
         api_key.rate_limits.append(rate_limit.dict())
         api_key.rate_limits = json.dumps(api_key.rate_limits)
         api_key.save()
+        rate_limiter_cache.invalidate(api_key.id)
     else:
         config.global_rate_limits.append(rate_limit.dict())
         config.save()
@@ -88,6 +90,7 @@ async def delete_rate_limit(index: int, api_key: Optional[str] = None):
         api_key.rate_limits.pop(index)
         api_key.rate_limits = json.dumps(api_key.rate_limits)
         api_key.save()
+        rate_limiter_cache.invalidate(api_key.id)
     else:
         if index < 0 or index >= len(config.global_rate_limits):
             raise HTTPException(status_code=400, detail="Invalid index.")
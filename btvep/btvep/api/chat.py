@@ -1,48 +1,60 @@
 from typing import Annotated, List
 
 from fastapi import APIRouter, Body, Depends, Header
+from fastapi.responses import StreamingResponse
 
-from btvep.api.dependencies import authenticate_api_key
+from btvep.api.dependencies import ParsedBody, authenticate_api_key, get_parsed_body
 from btvep.btvep_models import ChatResponse, Message
 from btvep.chat_helpers import (
+    log_cached_response,
     process_responses,
     query_network,
+    query_network_stream,
     raise_for_all_failed_responses,
     setup_async_loop,
+    stream_cached_response,
+    stream_responses,
 )
 from btvep.constants import COST, DEFAULT_UIDS
 from btvep.db.api_keys import ApiKey
-from btvep.db.api_keys import update as update_api_key
+from btvep.db.api_keys import increment_usage as increment_api_key_usage
+from btvep.response_cache import make_cache_key, response_cache
 
 router = APIRouter()
 
 
 def apply_default_query_strategy(
-    uids: List[int] | None, top_n: int | None, default_query_strategy: str | None
-) -> (List[int] | None, int | None):
+    uids: List[int] | None,
+    top_n: int | None,
+    default_query_strategy: str | None,
+    fastest_n: int | None = None,
+) -> (List[int] | None, int | None, int | None):
     """
-    Apply the default query strategy if neither uids nor top_n are specified.
+    Apply the default query strategy if neither uids, top_n nor fastest_n are specified.
     If no strategy is set, it returns DEFAULT_UIDS.
 
     Args:
     - uids: List of user ids or None.
     - top_n: Top n users or None.
     - default_query_strategy: The default strategy string.
+    - fastest_n: Fastest n users or None.
 
     Returns:
-    - Tuple containing modified uids and top_n.
+    - Tuple containing modified uids, top_n and fastest_n.
     """
-    if uids is None and top_n is None:
+    if uids is None and top_n is None and fastest_n is None:
         if default_query_strategy:
             strategy = default_query_strategy.split(":")
             if strategy[0] == "top_n":
                 top_n = int(strategy[1])
+            elif strategy[0] == "fastest_n":
+                fastest_n = int(strategy[1])
             elif strategy[0] == "uids":
                 uids = list(map(int, strategy[1].split(",")))
         else:
             uids = DEFAULT_UIDS
 
-    return uids, top_n
+    return uids, top_n, fastest_n
 
 
 @router.post("/chat")
@@ -55,36 +67,127 @@ async def chat(
             description="Query top miners based on incentive in the network. If set to for example 5, the top 5 miners will be sent the request. This parameter takes precedence over the uids parameter."
         ),
     ] = None,
+    fastest_n: Annotated[
+        int | None,
+        Body(
+            description="Query the n miners that have answered fastest and most reliably for this endpoint. Miners that have not been queried yet are ranked by incentive. Used if top_n is not set."
+        ),
+    ] = None,
     in_parallel: Annotated[int | None, Body()] = None,
     respond_on_first_success: Annotated[bool | None, Body()] = True,
+    hedge: Annotated[
+        bool | None,
+        Body(
+            description="Query miners one at a time and only send a backup request to the next miner if no successful response has arrived within hedge_delay seconds. Always responds on first success."
+        ),
+    ] = False,
+    hedge_delay: Annotated[
+        float | None,
+        Body(
+            description="Seconds to wait before sending a backup request when hedge is enabled. Defaults to the observed p90 latency of miners."
+        ),
+    ] = None,
     messages: Annotated[List[Message] | None, Body()] = None,
+    stream: Annotated[
+        bool | None,
+        Body(
+            description="Stream miner responses as Server-Sent Events as soon as they arrive instead of returning a single JSON body."
+        ),
+    ] = False,
     api_key: ApiKey = Depends(authenticate_api_key),
+    parsed_body: ParsedBody = Depends(get_parsed_body),
 ) -> ChatResponse:
     setup_async_loop()
-    uids, top_n = apply_default_query_strategy(
-        uids, top_n, api_key.default_query_strategy
+    uids, top_n, fastest_n = apply_default_query_strategy(
+        uids, top_n, api_key.default_query_strategy, fastest_n
     )
+
+    def charge_api_key(choices, response_count):
+        # Subtract cost if not unlimited - Only pay for successful responses (specific to chat function)
+        increment_api_key_usage(
+            api_key.api_key,
+            api_request_count=1,
+            request_count=response_count,
+            credits_used=0 if api_key.has_unlimited_credits() else COST * len(choices),
+        )
+
+    cache = response_cache if api_key.response_cache_enabled else None
+    if cache:
+        cache_key = make_cache_key(
+            messages,
+            uids=uids,
+            top_n=top_n,
+            fastest_n=fastest_n,
+            in_parallel=in_parallel,
+            respond_on_first_success=respond_on_first_success,
+            hedge=hedge,
+            hedge_delay=hedge_delay,
+        )
+        cached_response = await cache.get(cache_key)
+        if cached_response is not None:
+            log_cached_response(cached_response, parsed_body.prompt, authorization)
+            charge_api_key(cached_response["choices"], 0)
+            if stream:
+                return StreamingResponse(
+                    stream_cached_response(cached_response),
+                    media_type="text/event-stream",
+                )
+            return {**cached_response, "cached": True}
+
+    async def on_stream_complete(choices, failed_responses, response_count):
+        charge_api_key(choices, response_count)
+        if cache and choices:
+            await cache.set(
+                cache_key,
+                {
+                    "choices": [
+                        {k: v for k, v in choice.items() if k != "first_success"}
+                        for choice in choices
+                    ],
+                    "failed_responses": failed_responses,
+                },
+            )
+
+    if stream:
+        prompter_stream = query_network_stream(
+            messages,
+            uids,
+            top_n,
+            in_parallel,
+            respond_on_first_success,
+            fastest_n,
+            hedge,
+            hedge_delay,
+        )
+        return StreamingResponse(
+            stream_responses(
+                prompter_stream,
+                parsed_body.prompt,
+                authorization,
+                on_complete=on_stream_complete,
+            ),
+            media_type="text/event-stream",
+        )
+
     prompter_responses = await query_network(
-        messages, uids, top_n, in_parallel, respond_on_first_success
+        messages,
+        uids,
+        top_n,
+        in_parallel,
+        respond_on_first_success,
+        fastest_n,
+        hedge,
+        hedge_delay,
     )
     choices, failed_responses, all_failed = process_responses(
-        prompter_responses, messages, authorization
-    )
-
-    # Subtract cost if not unlimited - Only pay for successful responses (specific to chat function)
-    credits = (
-        None
-        if api_key.has_unlimited_credits() or all_failed
-        else api_key.credits - COST * len(choices)
-    )
-    update_api_key(
-        api_key.api_key,
-        api_request_count=api_key.api_request_count + 1,
-        request_count=api_key.request_count + len(prompter_responses),
-        credits=credits,
+        prompter_responses, parsed_body.prompt, authorization
     )
+    charge_api_key(choices, len(prompter_responses))
 
     if all_failed:
         raise_for_all_failed_responses(failed_responses)
 
-    return {"choices": choices, "failed_responses": failed_responses}
+    response = {"choices": choices, "failed_responses": failed_responses}
+    if cache:
+        await cache.set(cache_key, response)
+    return response
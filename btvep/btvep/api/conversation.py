@@ -1,11 +1,14 @@
 from typing import Annotated, List
 from fastapi import APIRouter, Body, Depends, Header
-from btvep.api.dependencies import authenticate_user
+from fastapi.responses import StreamingResponse
+from btvep.api.dependencies import ParsedBody, authenticate_user, get_parsed_body
 from btvep.chat_helpers import (
     process_responses,
     query_network,
+    query_network_stream,
     raise_for_all_failed_responses,
     setup_async_loop,
+    stream_responses,
 )
 
 from btvep.constants import DEFAULT_UIDS
@@ -28,27 +31,87 @@ async def conversation(
             description="Query top miners based on incentive in the network. If set to for example 5, the top 5 miners will be sent the request. This parameter takes precidence over the uids parameter."
         ),
     ] = None,
+    fastest_n: Annotated[
+        int | None,
+        Body(
+            description="Query the n miners that have answered fastest and most reliably for this endpoint. Miners that have not been queried yet are ranked by incentive. Used if top_n is not set."
+        ),
+    ] = None,
     in_parallel: Annotated[int | None, Body()] = None,
     respond_on_first_success: Annotated[bool | None, Body()] = True,
+    hedge: Annotated[
+        bool | None,
+        Body(
+            description="Query miners one at a time and only send a backup request to the next miner if no successful response has arrived within hedge_delay seconds. Always responds on first success."
+        ),
+    ] = False,
+    hedge_delay: Annotated[
+        float | None,
+        Body(
+            description="Seconds to wait before sending a backup request when hedge is enabled. Defaults to the observed p90 latency of miners."
+        ),
+    ] = None,
     messages: Annotated[List[Message] | None, Body()] = None,
+    stream: Annotated[
+        bool | None,
+        Body(
+            description="Stream miner responses as Server-Sent Events as soon as they arrive instead of returning a single JSON body."
+        ),
+    ] = False,
     user: User = Depends(authenticate_user),
+    parsed_body: ParsedBody = Depends(get_parsed_body),
 ) -> ChatResponse:
     setup_async_loop()
+
+    def increment_user_counts(response_count):
+        # Increment user request counts (specific to conversation function)
+        User.update(
+            {
+                User.api_request_count: User.api_request_count + 1,
+                User.request_count: User.request_count + response_count,
+            }
+        ).where(User.id == user.id).execute()
+
+    async def on_stream_complete(choices, failed_responses, response_count):
+        increment_user_counts(response_count)
+
+    if stream:
+        prompter_stream = query_network_stream(
+            messages,
+            uids,
+            top_n,
+            in_parallel,
+            respond_on_first_success,
+            fastest_n,
+            hedge,
+            hedge_delay,
+        )
+        return StreamingResponse(
+            stream_responses(
+                prompter_stream,
+                parsed_body.prompt,
+                authorization,
+                on_complete=on_stream_complete,
+            ),
+            media_type="text/event-stream",
+        )
+
     prompter_responses = await query_network(
-        messages, uids, top_n, in_parallel, respond_on_first_success
+        messages,
+        uids,
+        top_n,
+        in_parallel,
+        respond_on_first_success,
+        fastest_n,
+        hedge,
+        hedge_delay,
     )
     choices, failed_responses, all_failed = process_responses(
-        prompter_responses, messages, authorization
+        prompter_responses, parsed_body.prompt, authorization
     )
     print(all_failed, choices, failed_responses)
 
-    # Increment user request counts (specific to conversation function)
-    User.update(
-        {
-            "api_request_count": user.api_request_count + 1,
-            "request_count": user.request_count + len(prompter_responses),
-        }
-    ).where(User.id == user.id).execute()
+    increment_user_counts(len(prompter_responses))
 
     if all_failed:
         raise_for_all_failed_responses(failed_responses)
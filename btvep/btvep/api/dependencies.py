@@ -1,7 +1,7 @@
-import concurrent.futures
 import json
 import logging
 from datetime import datetime
+from functools import cached_property
 from math import ceil
 from typing import Annotated
 import uuid
@@ -13,17 +13,26 @@ import rich
 from fastapi import Depends, HTTPException, status
 from fastapi.security import HTTPBearer, OAuth2PasswordBearer
 from fastapi_limiter import FastAPILimiter
-from fastapi_limiter.depends import RateLimiter
 
-from btvep.config import Config
+from btvep.config import Config, config_snapshot
 from btvep.constants import COST
 from btvep.db.api_keys import ApiKey
-from btvep.db.api_keys import get_by_key as get_api_key_by_key
+from btvep.db.api_keys import get_by_key_cached as get_api_key_by_key
 from btvep.db.request import Request as DBRequest
-from btvep.db.user import User
+from btvep.db.user import user_cache
 from btvep.db.utils import db, db_state_default
-
-config = Config().load()
+from btvep.jwt_auth import JwksCache, TokenVerifier
+from btvep.rate_limit import (
+    LeasedRateLimiter,
+    LocalRateLimiter,
+    RateLimiter,
+    RateLimiterCache,
+    RateLimitState,
+    RedisRateLimiter,
+    rate_limit_identifier,
+)
+
+config = config_snapshot.get()
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 token_auth_scheme = HTTPBearer()
@@ -53,9 +62,6 @@ async def InitializeRateLimiting():
             config.redis_url, encoding="utf-8", decode_responses=True
         )
 
-        async def rate_limit_identifier(request: Request):
-            return request.headers.get("Authorization").split(" ")[1]
-
         await FastAPILimiter.init(redis_instance, identifier=rate_limit_identifier)
     except redis.asyncio.ConnectionError as e:
         rich.print(
@@ -64,26 +70,64 @@ async def InitializeRateLimiting():
         raise e
 
 
-filter = None
-if config.openai_filter_enabled:
+def create_filter(config: Config):
+    if not config.openai_filter_enabled:
+        return None
     if config.openai_api_key is None:
         raise Exception("OpenAI filter enabled, but openai_api_key is not set.")
-    from btvep.filter import OpenAIFilter
+    from btvep.filter import OpenAIFilter, VerdictCache
+
+    return OpenAIFilter(
+        config.openai_api_key,
+        api_base=config.openai_filter_api_base,
+        timeout_seconds=float(config.openai_filter_timeout_seconds),
+        max_concurrency=int(config.openai_filter_max_concurrency),
+        verdicts=VerdictCache(
+            ttl_seconds=int(config.openai_filter_cache_ttl_seconds),
+            max_entries=int(config.openai_filter_cache_max_entries),
+        ),
+        max_batch_size=int(config.openai_filter_batch_max_size),
+        max_batch_wait_seconds=int(config.openai_filter_batch_max_wait_ms) / 1000,
+    )
 
-    filter = OpenAIFilter(config.openai_api_key)
 
+def create_local_filter(config: Config):
+    if not config.moderation_blocklist and not config.moderation_allowlist:
+        return None
+    from btvep.filter import LocalFilter
+
+    return LocalFilter(config.moderation_blocklist, config.moderation_allowlist)
 
-async def authenticate_user(token: str = Depends(oauth2_scheme)):
-    config = Config().load()
 
-    # This gets the JWKS from a given URL and does processing so you can
-    # use any of the keys available
-    jwks_url = f"https://{config.auth0_domain}/.well-known/jwks.json"
-    jwks_client = jwt.PyJWKClient(jwks_url)
+def create_token_verifier(config: Config):
+    if config.auth0_domain is None:
+        return None
+    return TokenVerifier(
+        JwksCache(
+            f"https://{config.auth0_domain}/.well-known/jwks.json",
+            refresh_seconds=int(config.jwks_refresh_seconds),
+        ),
+        audience=config.auth0_api_audience,
+        issuer=config.auth0_issuer,
+    )
+
+
+filter = create_filter(config)
+local_filter = create_local_filter(config)
+token_verifier = create_token_verifier(config)
+
+
+async def authenticate_user(token: str = Depends(oauth2_scheme)):
+    config_snapshot.get()  # Picks up config changes
+    if token_verifier is None:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="User authentication is not configured, set auth0_domain.",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
 
-    signing_key = None
     try:
-        signing_key = jwks_client.get_signing_key_from_jwt(token).key
+        payload = await token_verifier.verify(token)
     except jwt.exceptions.PyJWKClientError as error:
         print("jwks error", error)
         raise HTTPException(
@@ -98,15 +142,6 @@ async def authenticate_user(token: str = Depends(oauth2_scheme)):
             detail=error.__str__(),
             headers={"WWW-Authenticate": "Bearer"},
         )
-
-    try:
-        payload = jwt.decode(
-            token,
-            signing_key,
-            algorithms="RS256",
-            audience=config.auth0_api_audience,
-            issuer=config.auth0_issuer,
-        )
     except Exception as e:
         print("token decode error", e)
         raise HTTPException(
@@ -115,7 +150,7 @@ async def authenticate_user(token: str = Depends(oauth2_scheme)):
             headers={"WWW-Authenticate": "Bearer"},
         )
     try:
-        user, created = User.get_or_create(id=payload["sub"])
+        user, created = user_cache.get_or_create(payload["sub"])
         if created:
             print("created user", user)
         return user
@@ -134,9 +169,52 @@ async def authenticate_admin(user=Depends(authenticate_user)):
     return user
 
 
+class ParsedBody:
+    """
+    JSON body of a chat request, decoded once per request and shared by all
+    dependencies and every log row written for the request.
+    """
+
+    def __init__(self, body):
+        self.body = body if isinstance(body, dict) else {}
+
+    @cached_property
+    def messages(self) -> list:
+        messages = self.body.get("messages")
+        return messages if isinstance(messages, list) else []
+
+    @cached_property
+    def prompt(self) -> str:
+        """The messages serialized for the prompt column of log rows."""
+        return json.dumps(self.body.get("messages"))
+
+    @cached_property
+    def message_contents(self) -> list[str]:
+        return [
+            message.get("content")
+            for message in self.messages
+            if isinstance(message, dict)
+        ]
+
+
+async def get_parsed_body(request: Request) -> ParsedBody:
+    # Stored on the request state, so callbacks outside of dependency injection share it too
+    parsed_body = getattr(request.state, "parsed_body", None)
+    if parsed_body is None:
+        try:
+            body = await request.json()
+        except json.JSONDecodeError:
+            body = None
+        parsed_body = request.state.parsed_body = ParsedBody(body)
+    return parsed_body
+
+
 async def authenticate_api_key(
-    request: Request, token: str = Depends(token_auth_scheme)
+    request: Request,
+    token: str = Depends(token_auth_scheme),
+    parsed_body: ParsedBody = Depends(get_parsed_body),
 ) -> ApiKey:
+    config_snapshot.get()  # Picks up config changes
     input_api_key = token.credentials
     print("authenticating api key", input_api_key)
 
@@ -147,13 +225,13 @@ async def authenticate_api_key(
             headers={"WWW-Authenticate": "Bearer"},
         )
 
-    async def createErrorRequest(error: str):
+    def createErrorRequest(error: str):
         api_request_id = str(uuid.uuid4())
         DBRequest.create(
             is_api_success=False,
             api_request_id=api_request_id,
             api_error=error,
-            prompt=json.dumps((await request.json())["messages"]),
+            prompt=parsed_body.prompt,
             api_key=input_api_key,
         )
 
@@ -183,17 +261,21 @@ async def authenticate_api_key(
 
     ###  API key is now validated. ###
 
-    if filter:
-        messages = (await request.json())["messages"]
-        messageContents = [message["content"] for message in messages]
+    contents = parsed_body.message_contents
+    if local_filter:
+        local_res = local_filter.check(contents)
+        if local_res["any_flagged"]:
+            createErrorRequest("FlaggedByLocalModerationFilter")
+            raiseKeyError("Moderation filter triggered")
+        # Allowlisted contents are not sent to the OpenAI filter
+        contents = local_res["unchecked"]
+
+    if filter and contents:
         try:
-            check_res = filter.safe_check(messageContents)
+            check_res = await filter.safe_check(contents)
             if check_res["any_flagged"]:
                 createErrorRequest("FlaggedByOpenAIModerationFilter")
                 raiseKeyError("OpenAI moderation filter triggered")
-        except concurrent.futures.TimeoutError as e:
-            logging.warning("OpenAI filter timed out. Allowing request.")
-            pass
         except openai.error.AuthenticationError:
             logging.warning("OpenAI filter auth error. Allowing request.")
             pass
@@ -201,29 +283,31 @@ async def authenticate_api_key(
     return api_key
 
 
-def get_rate_limits(api_key: str = None) -> list[RateLimiter]:
-    """Get rate limits. Leave api_key as None to get global rate limits."""
+def get_rate_limiter(api_key: ApiKey = None) -> RateLimiter | None:
+    """Get the rate limiter of an API key. Leave api_key as None to get the global rate limiter."""
 
     if not config.rate_limiting_enabled:
-        return []
+        return None
     rate_limits = None
     if api_key is not None:
         rate_limits = json.loads(api_key.rate_limits)
     elif config.rate_limiting_enabled:
         rate_limits = config.global_rate_limits
+    if not rate_limits:
+        return None
 
     HTTP_429_TOO_MANY_REQUESTS = 429
 
-    async def ratelimit_callback(request, response, pexpire, limit):
+    async def ratelimit_callback(request, response, pexpire):
         print(
-            f"Rate limit triggered for ratelimit rule: {limit}",
+            f"Rate limit triggered for ratelimit rules: {rate_limits}",
         )
         api_request_id = str(uuid.uuid4())
         DBRequest.create(
             is_api_success=False,
             api_request_id=api_request_id,
             api_error="RateLimitExceeded",
-            prompt=json.dumps((await request.json())["messages"]),
+            prompt=(await get_parsed_body(request)).prompt,
             api_key=request.headers.get("authorization").split(" ")[1],
         )
 
@@ -235,26 +319,62 @@ def get_rate_limits(api_key: str = None) -> list[RateLimiter]:
             headers={"Retry-After": str(expire)},
         )
 
-    rate_limiters = [
-        RateLimiter(
-            times=limit["times"],
-            seconds=limit["seconds"],
-            callback=lambda request, response, pexpire: ratelimit_callback(
-                request, response, pexpire, limit
-            ),
+    if config.rate_limiting_backend == "local":
+        return LocalRateLimiter(rate_limits, ratelimit_callback, rate_limit_state)
+    if config.rate_limiting_backend == "hybrid":
+        return LeasedRateLimiter(
+            rate_limits,
+            ratelimit_callback,
+            rate_limit_state,
+            lease_size=int(config.rate_limiting_lease_size),
         )
-        for limit in rate_limits
-    ]
+    return RedisRateLimiter(rate_limits, ratelimit_callback)
 
-    # Sort the list in ascending order by the ratio of milliseconds to times
-    sorted_rate_limiters = sorted(
-        rate_limiters, key=lambda rl: rl.milliseconds / rl.times
-    )
 
-    return sorted_rate_limiters
+rate_limit_state = RateLimitState()
+global_rate_limiter = get_rate_limiter()
+rate_limiter_cache = RateLimiterCache(get_rate_limiter)
 
 
-global_rate_limits = get_rate_limits()
+def on_config_reload(new_config: Config, old_config: Config):
+    global config, filter, local_filter, token_verifier, global_rate_limiter
+    config = new_config
+    global_rate_limiter = get_rate_limiter()
+    rate_limit_settings = [
+        "rate_limiting_enabled",
+        "rate_limiting_backend",
+        "rate_limiting_lease_size",
+    ]
+    if any(
+        getattr(new_config, k) != getattr(old_config, k) for k in rate_limit_settings
+    ):
+        rate_limiter_cache.invalidate()
+    filter_settings = [
+        "openai_filter_enabled",
+        "openai_api_key",
+        "openai_filter_timeout_seconds",
+        "openai_filter_max_concurrency",
+        "openai_filter_cache_ttl_seconds",
+        "openai_filter_cache_max_entries",
+        "openai_filter_api_base",
+        "openai_filter_batch_max_size",
+        "openai_filter_batch_max_wait_ms",
+    ]
+    if any(getattr(new_config, k) != getattr(old_config, k) for k in filter_settings):
+        if filter is not None:
+            filter.close()
+        filter = create_filter(new_config)
+    moderation_lists = ["moderation_blocklist", "moderation_allowlist"]
+    if any(getattr(new_config, k) != getattr(old_config, k) for k in moderation_lists):
+        local_filter = create_local_filter(new_config)
+    auth_settings = ["auth0_domain", "auth0_api_audience", "auth0_issuer"]
+    if any(getattr(new_config, k) != getattr(old_config, k) for k in auth_settings):
+        if token_verifier is not None:
+            token_verifier.close()
+        token_verifier = create_token_verifier(new_config)
+
+
+config_snapshot.subscribe(on_config_reload)
 
 
 def VerifyAPIKeyAndLimit():
@@ -263,11 +383,16 @@ def VerifyAPIKeyAndLimit():
         response: Response,
         api_key: Annotated[ApiKey, Depends(authenticate_api_key)],
     ):
-        for ratelimit in (
-            get_rate_limits(api_key)
+        rate_limiter = (
+            rate_limiter_cache.get(api_key)
             if api_key and api_key.rate_limits
-            else global_rate_limits
-        ):
-            await ratelimit(request, response)
+            else global_rate_limiter
+        )
+        if rate_limiter is None:
+            return
+        # Rate limiting may have been enabled after startup
+        if rate_limiter.uses_redis and FastAPILimiter.redis is None:
+            await InitializeRateLimiting()
+        await rate_limiter(request, response)
 
     return a
@@ -0,0 +1,20 @@
+from fastapi import APIRouter, Response, status
+
+from btvep.validator_prompter import ValidatorPrompter
+
+router = APIRouter()
+
+
+@router.get("/health")
+async def get_health(response: Response):
+    """
+    Health of the endpoint and how fresh its routing data is.
+    Returns 503 until a metagraph has been synced or loaded from a snapshot.
+    """
+    metagraph = ValidatorPrompter().metagraph_syncer.health()
+    if not metagraph["synced"]:
+        response.status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    return {
+        "status": "ok" if metagraph["synced"] else "unavailable",
+        "metagraph": metagraph,
+    }
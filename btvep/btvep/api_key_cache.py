@@ -0,0 +1,125 @@
+import asyncio
+import json
+import logging
+from typing import Any, Callable, Dict, Optional
+
+import redis
+import redis.asyncio
+
+from btvep.ttl_cache import TTLCache
+
+
+class ApiKeyCache:
+    """
+    In-process cache of API key records by token, so authenticating a request
+    does not hit the database.
+
+    - Entries expire after ttl_seconds. This also bounds how stale a key can be
+      if it was changed by another process and no invalidation reached us.
+    - Unknown tokens are cached as negative entries. There are at most
+      max_negative_entries of them, so a flood of invalid keys can't grow the cache.
+    - invalidate() drops a key by token or id, apply_usage() updates the
+      counters and credits of a cached key in place.
+    """
+
+    def __init__(
+        self,
+        load: Callable[[str], Optional[Any]],
+        ttl_seconds: float,
+        max_entries: int,
+        max_negative_entries: int,
+    ):
+        self.load = load
+        # token -> api key
+        self.entries = TTLCache(max_entries, ttl_seconds, on_remove=self._removed)
+        # token -> True
+        self.negative_entries = TTLCache(max_negative_entries, ttl_seconds)
+        self.tokens_by_id: Dict[int, str] = {}
+
+    def get(self, token: str):
+        api_key = self.entries.get(token)
+        if api_key is not None:
+            return api_key
+        if self.negative_entries.get(token):
+            return None
+
+        api_key = self.load(token)
+        if api_key is None:
+            self.negative_entries.set(token, True)
+        else:
+            self.entries.set(token, api_key)
+            self.tokens_by_id[api_key.id] = token
+        return api_key
+
+    def invalidate(self, query: str | int | None = None):
+        """Drop the key with the given token or id, or every key if query is None."""
+        if query is None:
+            self.entries.clear()
+            self.negative_entries.clear()
+            self.tokens_by_id.clear()
+            return
+        query = str(query)
+        self.negative_entries.pop(query)
+        self.entries.pop(query)
+        if query.isdigit() and int(query) in self.tokens_by_id:
+            self.entries.pop(self.tokens_by_id[int(query)])
+
+    def apply_usage(
+        self,
+        query: str | int,
+        api_request_count: int = 0,
+        request_count: int = 0,
+        credits_used: int = 0,
+    ):
+        """Apply usage that was written to the database to the cached key, if any."""
+        query = str(query)
+        token = self.tokens_by_id.get(int(query)) if query.isdigit() else query
+        api_key = self.entries.get(token)
+        if api_key is None:
+            return
+        api_key.api_request_count += api_request_count
+        api_key.request_count += request_count
+        if credits_used:
+            api_key.credits -= credits_used
+
+    def _removed(self, token: str, api_key):
+        self.tokens_by_id.pop(api_key.id, None)
+
+
+class RedisInvalidationChannel:
+    """
+    Broadcasts API key invalidations to every process through Redis pub/sub,
+    so keys changed by another worker or the CLI are dropped right away.
+    """
+
+    channel = "btvep:api-key-invalidations"
+
+    def __init__(self, redis_url: str):
+        self.redis_url = redis_url
+        self.redis = redis.Redis.from_url(redis_url)
+
+    def publish(self, query: str | int | None):
+        try:
+            self.redis.publish(self.channel, json.dumps({"query": query}))
+        except redis.RedisError as e:
+            logging.warning(f"Could not publish API key invalidation: {e}")
+
+    async def listen(self, on_invalidate: Callable[[str | int | None], None]):
+        """Call on_invalidate for every invalidation. Reconnects if Redis goes away."""
+        while True:
+            client = redis.asyncio.from_url(self.redis_url)
+            pubsub = client.pubsub()
+            try:
+                await pubsub.subscribe(self.channel)
+                # Invalidations may have been missed while disconnected
+                on_invalidate(None)
+                async for message in pubsub.listen():
+                    if message["type"] == "message":
+                        on_invalidate(json.loads(message["data"])["query"])
+            except redis.RedisError as e:
+                logging.warning(f"API key invalidation channel disconnected: {e}")
+            finally:
+                # Don't leak a connection pool on every reconnect
+                await pubsub.aclose()
+                await client.aclose()
+            await asyncio.sleep(5)
@@ -36,3 +36,4 @@ class FailedMinerResponse(BaseModel):
 class ChatResponse(BaseModel):
     choices: List[ChatResponseChoice]
     failed_responses: List[FailedMinerResponse]
+    cached: bool = False
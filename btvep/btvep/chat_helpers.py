@@ -1,6 +1,16 @@
 import asyncio
+import heapq
 import json
-from typing import Union, List, Tuple, Dict
+from typing import (
+    AsyncGenerator,
+    AsyncIterator,
+    Awaitable,
+    Callable,
+    Union,
+    List,
+    Tuple,
+    Dict,
+)
 from fastapi import HTTPException
 from enum import Enum
 
@@ -10,7 +20,14 @@ from btvep.btvep_models import (
     Message,
 )
 
-from btvep.validator_prompter import MetagraphNotSyncedException, ValidatorPrompter
+from btvep.config import config_snapshot
+from btvep.response_cache import make_cache_key
+from btvep.single_flight import SingleFlight
+from btvep.validator_prompter import (
+    MetagraphNotSyncedException,
+    NoAvailableUidsException,
+    ValidatorPrompter,
+)
 import uuid
 from btvep.db.request import Request
 
@@ -21,6 +38,10 @@ def setup_async_loop():
     asyncio.set_event_loop(loop)
 
 
+# Identical concurrent requests share a single network query
+single_flight = SingleFlight()
+
+
 # Querying the Network
 async def query_network(
     messages: List[Message],
@@ -28,81 +49,238 @@ async def query_network(
     top_n: int,
     in_parallel: int,
     respond_on_first_success: bool,
+    fastest_n: int = None,
+    hedge: bool = False,
+    hedge_delay: float = None,
 ) -> dict:
+    query_strategy = dict(
+        uids=uids,
+        top_n=top_n,
+        in_parallel=in_parallel,
+        respond_on_first_success=respond_on_first_success,
+        fastest_n=fastest_n,
+        hedge=hedge,
+        hedge_delay=hedge_delay,
+    )
     try:
-        return await ValidatorPrompter().query_network(
+        if not config_snapshot.get().request_coalescing_enabled:
+            return await ValidatorPrompter().query_network(messages, **query_strategy)
+        return await single_flight.do(
+            make_cache_key(messages, **query_strategy),
+            lambda: ValidatorPrompter().query_network(messages, **query_strategy),
+        )
+    except MetagraphNotSyncedException as e:
+        raise HTTPException(
+            detail="Metagraph is not synced yet. Please try again later.",
+            status_code=500,
+        ) from e
+    except NoAvailableUidsException as e:
+        raise HTTPException(
+            detail="All requested miners are currently unavailable. Please try again later or query other uids.",
+            status_code=503,
+        ) from e
+
+
+def query_network_stream(
+    messages: List[Message],
+    uids: List[int],
+    top_n: int,
+    in_parallel: int,
+    respond_on_first_success: bool,
+    fastest_n: int = None,
+    hedge: bool = False,
+    hedge_delay: float = None,
+) -> AsyncGenerator[dict, None]:
+    try:
+        return ValidatorPrompter().query_network_stream(
             messages=messages,
             uids=uids,
             top_n=top_n,
             in_parallel=in_parallel,
             respond_on_first_success=respond_on_first_success,
+            fastest_n=fastest_n,
+            hedge=hedge,
+            hedge_delay=hedge_delay,
         )
     except MetagraphNotSyncedException as e:
         raise HTTPException(
             detail="Metagraph is not synced yet. Please try again later.",
             status_code=500,
         ) from e
+    except NoAvailableUidsException as e:
+        raise HTTPException(
+            detail="All requested miners are currently unavailable. Please try again later or query other uids.",
+            status_code=503,
+        ) from e
+
+
+# Processing a single Response
+def process_response(
+    p_response: dict, prompt: str, authorization: str
+) -> Tuple[bool, Dict]:
+    """
+    Log a single prompter response and format it.
+    prompt is the serialized messages of the request, see ParsedBody.prompt.
+    Returns a tuple of (is_success, choice or failed response without index).
+    """
+    dendrite_res = p_response["dendrite_response"]
+    uid = p_response["uid"]
+
+    Request.create(
+        is_api_success=True,
+        api_request_id=str(uuid.uuid4()),
+        prompt=prompt,
+        user_id=authorization.split(" ")[
+            1
+        ],  # Assuming API key is also passed in the same format.
+        response=dendrite_res.completion,
+        responder_hotkey=dendrite_res.dest_hotkey,
+        is_success=dendrite_res.is_completion,
+        return_message=dendrite_res.return_message,
+        elapsed_time=dendrite_res.elapsed,
+        src_version=dendrite_res.src_version,
+        dest_version=dendrite_res.dest_version,
+        return_code=dendrite_res.return_message,
+    )
+
+    response_ms = int(dendrite_res.elapsed * 1000)
+
+    if dendrite_res.is_completion:
+        return True, {
+            "message": {
+                "role": "assistant",
+                "content": dendrite_res.completion,
+            },
+            "uid": uid,
+            "responder_hotkey": dendrite_res.dest_hotkey,
+            "response_ms": response_ms,
+        }
+    return False, {
+        "error": dendrite_res.return_message,
+        "uid": uid,
+        "responder_hotkey": dendrite_res.dest_hotkey,
+        "response_ms": response_ms,
+    }
 
 
 # Processing the Responses
 def process_responses(
-    prompter_responses: dict, messages: List[Message], authorization: str
+    prompter_responses: dict, prompt: str, authorization: str
 ) -> Tuple[List[ChatResponseChoice], List[FailedMinerResponse]]:
     choices = []
     failed_responses = []
-    success_index = 0
-    failed_index = 0
     for p_response in prompter_responses:
-        dendrite_res = p_response["dendrite_response"]
-        uid = p_response["uid"]
+        is_success, response = process_response(p_response, prompt, authorization)
+        if is_success:
+            choices.append({"index": len(choices), **response})
+        else:
+            failed_responses.append({"index": len(failed_responses), **response})
 
-        Request.create(
-            is_api_success=True,
-            api_request_id=str(uuid.uuid4()),
-            prompt=json.dumps([message.dict() for message in messages]),
-            user_id=authorization.split(" ")[
-                1
-            ],  # Assuming API key is also passed in the same format.
-            response=dendrite_res.completion,
-            responder_hotkey=dendrite_res.dest_hotkey,
-            is_success=dendrite_res.is_completion,
-            return_message=dendrite_res.return_message,
-            elapsed_time=dendrite_res.elapsed,
-            src_version=dendrite_res.src_version,
-            dest_version=dendrite_res.dest_version,
-            return_code=dendrite_res.return_message,
-        )
+    all_failed = len(failed_responses) == len(prompter_responses)
+    return choices, failed_responses, all_failed
 
-        response_ms = int(dendrite_res.elapsed * 1000)
 
-        if dendrite_res.is_completion:
-            choices.append(
-                {
-                    "index": success_index,
-                    "message": {
-                        "role": "assistant",
-                        "content": dendrite_res.completion,
-                    },
-                    "uid": uid,
-                    "responder_hotkey": dendrite_res.dest_hotkey,
-                    "response_ms": response_ms,
+def format_sse(event: str, data: dict) -> str:
+    """Format a single Server-Sent Event."""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+# Streaming the Responses
+async def stream_responses(
+    prompter_stream: AsyncGenerator[dict, None],
+    prompt: str,
+    authorization: str,
+    on_complete: Callable[[List[Dict], List[Dict], int], Awaitable[None]],
+) -> AsyncIterator[str]:
+    """
+    Emit a Server-Sent Event for each miner response as soon as it lands.
+
+    Events:
+    - `choice`: a successful response. The first one has `first_success` set to true.
+    - `failed_response`: a failed miner response.
+    - `error`: emitted if all miner responses have failed.
+    - `done`: always emitted last, after which the stream is closed.
+
+    on_complete is awaited with (choices, failed_responses, response_count) once the
+    network query is finished, so callers can do their bookkeeping (credits, counts).
+    """
+    choices = []
+    failed_responses = []
+    response_count = 0
+    try:
+        async for p_response in prompter_stream:
+            response_count += 1
+            is_success, response = process_response(p_response, prompt, authorization)
+            if is_success:
+                choice = {
+                    "index": len(choices),
+                    "first_success": len(choices) == 0,
+                    **response,
                 }
-            )
-            success_index += 1
-        else:
-            failed_responses.append(
+                choices.append(choice)
+                yield format_sse("choice", choice)
+            else:
+                failed_response = {"index": len(failed_responses), **response}
+                failed_responses.append(failed_response)
+                yield format_sse("failed_response", failed_response)
+
+        if len(choices) == 0:
+            yield format_sse(
+                "error",
                 {
-                    "index": failed_index,
-                    "error": dendrite_res.return_message,
-                    "uid": uid,
-                    "responder_hotkey": dendrite_res.dest_hotkey,
-                    "response_ms": response_ms,
-                }
+                    "detail": "All miner responses have failed.",
+                    "failed_responses": failed_responses,
+                },
             )
-            failed_index += 1
+        yield format_sse(
+            "done",
+            {"choices": len(choices), "failed_responses": len(failed_responses)},
+        )
+    finally:
+        await prompter_stream.aclose()
+        await on_complete(choices, failed_responses, response_count)
 
-    all_failed = len(failed_responses) == len(prompter_responses)
-    return choices, failed_responses, all_failed
+
+# Cached Responses
+def log_cached_response(response: dict, prompt: str, authorization: str):
+    """Log a request row for each choice served from the response cache."""
+    api_request_id = str(uuid.uuid4())
+    for choice in response["choices"]:
+        Request.create(
+            is_api_success=True,
+            api_request_id=api_request_id,
+            prompt=prompt,
+            user_id=authorization.split(" ")[1],
+            response=choice["message"]["content"],
+            responder_hotkey=choice["responder_hotkey"],
+            is_success=True,
+            return_message="Cached response",
+        )
+
+
+async def stream_cached_response(response: dict) -> AsyncIterator[str]:
+    """
+    Emit a cached response with the same events as stream_responses. Choices
+    and failed responses are interleaved by their response time, the order
+    they came in when all uids were queried at once.
+    """
+    responses = heapq.merge(
+        [("choice", choice) for choice in response["choices"]],
+        [("failed_response", failed) for failed in response["failed_responses"]],
+        key=lambda response: response[1]["response_ms"],
+    )
+    for event, data in responses:
+        if event == "choice":
+            data = {**data, "first_success": data["index"] == 0}
+        yield format_sse(event, {**data, "cached": True})
+    yield format_sse(
+        "done",
+        {
+            "choices": len(response["choices"]),
+            "failed_responses": len(response["failed_responses"]),
+            "cached": True,
+        },
+    )
 
 
 class ChatResponseException(Exception):
@@ -0,0 +1,115 @@
+import time
+from dataclasses import dataclass
+from enum import Enum
+from typing import Dict, Optional
+
+
+class BreakerState(str, Enum):
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+
+@dataclass
+class CircuitBreaker:
+    hotkey: str
+    state: BreakerState = BreakerState.CLOSED
+    failures: int = 0
+    opened_at: Optional[float] = None
+    probe_in_flight: bool = False
+
+
+class CircuitBreakerRegistry:
+    """
+    Circuit breakers per UID and hotkey.
+
+    - closed: the uid is queried as usual. After failure_threshold consecutive
+      failures the breaker opens.
+    - open: the uid is skipped until open_seconds have passed.
+    - half_open: a single probe query is let through. If it succeeds the breaker
+      closes, if it fails the breaker opens again.
+
+    A breaker is reset when a new hotkey is registered on its uid.
+    """
+
+    def __init__(self, failure_threshold: int = 3, open_seconds: float = 60):
+        self.failure_threshold = failure_threshold
+        self.open_seconds = open_seconds
+        self.breakers: Dict[int, CircuitBreaker] = {}
+
+    def _get(self, uid: int, hotkey: str) -> CircuitBreaker:
+        breaker = self.breakers.get(uid)
+        if breaker is None or breaker.hotkey != hotkey:
+            breaker = self.breakers[uid] = CircuitBreaker(hotkey=hotkey)
+        return breaker
+
+    def _open_period_passed(self, breaker: CircuitBreaker) -> bool:
+        return time.monotonic() - breaker.opened_at >= self.open_seconds
+
+    def is_available(self, uid: int, hotkey: str) -> bool:
+        """Whether the uid could be queried right now. Does not change any state."""
+        breaker = self.breakers.get(uid)
+        # No breaker yet, or one that is reset on the next query
+        if breaker is None or breaker.hotkey != hotkey:
+            return True
+        if breaker.state == BreakerState.CLOSED:
+            return True
+        if breaker.state == BreakerState.OPEN:
+            return self._open_period_passed(breaker)
+        return not breaker.probe_in_flight
+
+    def allow(self, uid: int, hotkey: str) -> bool:
+        """
+        Whether a query to the uid may be started. Once the open period has
+        passed, this lets a single probe through and moves the breaker to half open.
+        """
+        breaker = self._get(uid, hotkey)
+        if breaker.state == BreakerState.CLOSED:
+            return True
+        if breaker.state == BreakerState.OPEN:
+            if not self._open_period_passed(breaker):
+                return False
+            breaker.state = BreakerState.HALF_OPEN
+        if breaker.probe_in_flight:
+            return False
+        breaker.probe_in_flight = True
+        return True
+
+    def record(self, uid: int, hotkey: str, is_success: bool):
+        breaker = self._get(uid, hotkey)
+        breaker.probe_in_flight = False
+        if is_success:
+            breaker.state = BreakerState.CLOSED
+            breaker.failures = 0
+            breaker.opened_at = None
+            return
+
+        breaker.failures += 1
+        if (
+            breaker.state == BreakerState.HALF_OPEN
+            or breaker.failures >= self.failure_threshold
+        ):
+            breaker.state = BreakerState.OPEN
+            breaker.opened_at = time.monotonic()
+
+    def release(self, uid: int):
+        """Release a probe that was cancelled before it got a response."""
+        breaker = self.breakers.get(uid)
+        if breaker is not None:
+            breaker.probe_in_flight = False
+
+    def to_dict(self) -> Dict[int, dict]:
+        now = time.monotonic()
+        return {
+            uid: {
+                "hotkey": breaker.hotkey,
+                "state": breaker.state,
+                "failures": breaker.failures,
+                "open_seconds_left": max(
+                    0, self.open_seconds - (now - breaker.opened_at)
+                )
+                if breaker.state == BreakerState.OPEN
+                else None,
+            }
+            for uid, breaker in self.breakers.items()
+        }
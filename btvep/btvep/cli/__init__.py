@@ -12,6 +12,7 @@ from . import config
 from . import ratelimit
 from . import logs
 from . import user
+from . import moderation
 
 app = typer.Typer(help="Bitensor Validator Endpoint CLI", rich_markup_mode="rich")
 
@@ -54,13 +55,21 @@ def start(
             help="Enable auto-reload on changes (for development).",
         ),
     ] = False,
+    workers: Annotated[
+        int,
+        typer.Option(
+            help="Number of worker processes. Enable metagraph_sharing_enabled to sync the metagraph only once for all workers.",
+        ),
+    ] = 1,
 ):
     """
     Start the API server.
     """
     import uvicorn
 
-    uvicorn.run("btvep.server:app", host="0.0.0.0", port=port, reload=reload)
+    uvicorn.run(
+        "btvep.server:app", host="0.0.0.0", port=port, reload=reload, workers=workers
+    )
 
 
 app.add_typer(key.app, name="key")
@@ -68,3 +77,4 @@ app.add_typer(config.app, name="config")
 app.add_typer(ratelimit.app, name="ratelimit")
 app.add_typer(logs.app, name="logs")
 app.add_typer(user.app, name="user")
+app.add_typer(moderation.app, name="moderation")
@@ -15,12 +15,47 @@ General Config values available:
 - hotkey_mnemonic - The hotkey mnemonic for the validator. This is required as the validator will be signing the prompts to miners.
 - openai_filter_enabled - Whether to use OpenAI's content filter. If enabled, the openai_api_key will be used.
 - openai_api_key - The OpenAI API key to use for the content filter.
+- openai_filter_timeout_seconds - Requests are allowed if the content filter takes longer than this.
+- openai_filter_max_concurrency - Max number of content filter calls in flight at once, shared by all requests.
+- openai_filter_cache_ttl_seconds - How long content filter verdicts are cached by message content. 0 disables the cache.
+- openai_filter_cache_max_entries - Max number of cached content filter verdicts.
+- openai_filter_batch_max_size - Max number of message contents sent in one content filter call. Contents of concurrent requests are batched together.
+- openai_filter_batch_max_wait_ms - How long a request waits for others to join its content filter batch.
+- openai_filter_api_base - Base url of the moderation API, defaults to OpenAI's.
+- moderation_blocklist - Words and phrases that are rejected without calling the OpenAI filter. Prefer to use btvep moderation to manage it.
+- moderation_allowlist - Exact message contents (e.g. system prompts) that are not sent to the OpenAI filter. Prefer to use btvep moderation to manage it.
+- metagraph_snapshot_max_staleness_seconds - Max age of the metagraph snapshot saved to disk that is used to serve requests right after startup, until the first metagraph sync has finished.
+- metagraph_sharing_enabled - Whether workers share one metagraph. Only the worker holding a file lock syncs with the chain, the others memory map its snapshots. Recommended when running with --workers.
 
 Rate Limiting Config values available:
 
 - rate_limiting_enabled - Whether to enable rate limiting. If enabled, the global_rate_limits will be used.
 - redis_url - The redis url to use for rate limiting.
 - global_rate_limits - A list of rate limits. Prefer to use btvep ratelimit to manage rate limits.
+- rate_limiting_backend - redis (fixed windows shared by all workers), local (per process token buckets, no Redis needed) or hybrid (workers lease requests from Redis in batches and spend them locally).
+- rate_limiting_lease_size - How many requests a worker leases from Redis at once (hybrid backend). A key can be rejected up to this many requests early per worker.
+
+Response Cache Config values available:
+
+- response_cache_enabled - Whether to serve identical requests from a response cache. Can be disabled per API key.
+- response_cache_backend - memory (per process) or redis (shared by all workers, uses redis_url).
+- response_cache_ttl_seconds - How long a response stays cached.
+- response_cache_max_entries - Max number of cached responses (memory backend).
+- response_cache_max_bytes - Max total size of cached responses in bytes (memory backend).
+- request_coalescing_enabled - Whether identical requests that arrive at the same time share a single network query.
+
+API Key Cache Config values available:
+
+- api_key_cache_ttl_seconds - How long API keys are cached in memory. Bounds how long a change made by another process takes to apply. 0 disables the cache.
+- api_key_cache_max_entries - Max number of cached API keys.
+- api_key_cache_max_negative_entries - Max number of cached invalid API keys.
+- api_key_cache_redis_invalidation_enabled - Whether to broadcast API key changes to all workers and the CLI through Redis pub/sub (uses redis_url).
+
+Auth Config values available:
+
+- auth0_domain, auth0_api_audience, auth0_issuer - Auth0 settings used to verify user tokens.
+- jwks_refresh_seconds - How often the signing keys of auth0_domain are refetched in the background. Unknown keys also trigger a refetch.
+- user_cache_ttl_seconds - How long users are cached in memory. Bounds how long a change made by another process (e.g. btvep user edit) takes to apply.
 
 
 Example usage:
@@ -70,6 +105,8 @@ def set(
         # cast to correct type
         if type(config.__dict__[key]) == bool:
             value = cast_str_to_bool(value)
+        elif type(config.__dict__[key]) == int:
+            value = int(value)
         config.__dict__[key] = value
         config.save()
     else:
@@ -123,6 +123,14 @@ def edit(
             help="Enable or disable the API key.",
         ),
     ] = None,
+    response_cache_enabled: Annotated[
+        bool,
+        typer.Option(
+            "--response-cache/--no-response-cache",
+            show_default=False,
+            help="Allow or disallow responses for the API key to be served from the response cache.",
+        ),
+    ] = None,
 ):
     """
     Edit an API key.
@@ -160,11 +168,12 @@ def edit(
 
     api_keys.update(
         query,
-        api_key_hint,
-        name,
-        request_count,
-        parsed_valid_until,
-        credits,
-        enabled,
+        api_key_hint=api_key_hint,
+        name=name,
+        request_count=request_count,
+        valid_until=parsed_valid_until,
+        credits=credits,
+        enabled=enabled,
+        response_cache_enabled=response_cache_enabled,
     )
     print(api_keys.get(query))
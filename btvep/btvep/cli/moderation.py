@@ -0,0 +1,98 @@
+from typing import Annotated, Literal
+
+import rich
+from rich.table import Table
+
+import typer
+
+from btvep.config import Config
+
+help_text = """
+    Local moderation lists, checked before the OpenAI filter.
+    Messages containing a blocklist word or phrase are rejected right away.
+    Messages that exactly match an allowlist entry (e.g. a system prompt) are not sent to the OpenAI filter.
+    """
+app = typer.Typer(help=help_text)
+
+
+def print_moderation_table(list_name: Literal["blocklist", "allowlist"]):
+    table = Table(title=f"Moderation {list_name}")
+    table.width = 80
+    table.add_column("Index")
+    table.add_column("Value")
+
+    for i, value in enumerate(getattr(Config().load(), f"moderation_{list_name}")):
+        table.add_row(str(i), value)
+    rich.print(table)
+
+
+@app.callback(invoke_without_command=True)
+def main(ctx: typer.Context):
+    if ctx.invoked_subcommand is None:
+        print_moderation_table("blocklist")
+        print_moderation_table("allowlist")
+        print(ctx.get_help())
+
+
+ValueArgument = Annotated[
+    str,
+    typer.Argument(help="The word, phrase or message content."),
+]
+IndexArgument = Annotated[
+    int,
+    typer.Argument(help="The index (starts at 0) of the entry to delete."),
+]
+
+
+def add_entry(list_name: str, value: str):
+    if not value.strip():
+        raise typer.BadParameter("Value can't be empty.")
+    config = Config().load()
+    entries = getattr(config, f"moderation_{list_name}")
+    if value not in entries:
+        entries.append(value)
+        config.save()
+    print_moderation_table(list_name)
+
+
+def delete_entry(list_name: str, index: int):
+    config = Config().load()
+    entries = getattr(config, f"moderation_{list_name}")
+    try:
+        entries.pop(index)
+    except IndexError:
+        raise typer.BadParameter(f"Entry with index {index} does not exist.")
+    config.save()
+    print_moderation_table(list_name)
+
+
+@app.command()
+def block(value: ValueArgument):
+    """
+    Add a word or phrase to the blocklist.
+    """
+    add_entry("blocklist", value)
+
+
+@app.command()
+def unblock(index: IndexArgument):
+    """
+    Delete an entry from the blocklist.
+    """
+    delete_entry("blocklist", index)
+
+
+@app.command()
+def allow(value: ValueArgument):
+    """
+    Add a message content to the allowlist.
+    """
+    add_entry("allowlist", value)
+
+
+@app.command()
+def disallow(index: IndexArgument):
+    """
+    Delete an entry from the allowlist.
+    """
+    delete_entry("allowlist", index)
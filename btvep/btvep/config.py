@@ -1,6 +1,8 @@
 import os
 import json
-from typing import List
+import logging
+import time
+from typing import Callable, List, Optional, Tuple
 from rich.console import Console
 import typer
 
@@ -26,11 +28,36 @@ class Config(BaseModel):
     rate_limiting_enabled = False
     redis_url = "redis://localhost"
     global_rate_limits: List[RateLimitEntry] = []
+    rate_limiting_backend = "redis"
+    rate_limiting_lease_size = 10
     openai_filter_enabled = False
     openai_api_key: str | None = None
+    openai_filter_timeout_seconds = 5
+    openai_filter_max_concurrency = 8
+    openai_filter_cache_ttl_seconds = 3600
+    openai_filter_cache_max_entries = 10_000
+    openai_filter_batch_max_size = 32
+    openai_filter_batch_max_wait_ms = 5
+    openai_filter_api_base: str | None = None
+    moderation_blocklist: List[str] = []
+    moderation_allowlist: List[str] = []
     auth0_domain: str | None = None
     auth0_api_audience: str | None = None
     auth0_issuer: str | None = None
+    response_cache_enabled = False
+    response_cache_backend = "memory"
+    response_cache_ttl_seconds = 300
+    response_cache_max_entries = 1000
+    response_cache_max_bytes = 50_000_000
+    request_coalescing_enabled = True
+    metagraph_snapshot_max_staleness_seconds = 3600
+    metagraph_sharing_enabled = False
+    api_key_cache_ttl_seconds = 10
+    api_key_cache_max_entries = 10_000
+    api_key_cache_max_negative_entries = 1000
+    api_key_cache_redis_invalidation_enabled = False
+    jwks_refresh_seconds = 600
+    user_cache_ttl_seconds = 30
 
     source_info = {}
 
@@ -50,9 +77,13 @@ class Config(BaseModel):
         )
 
     def save(self):
-        #  save to a json file
-        with open(CONFIG_PATH, "w") as jsonfile:
+        #  save to a json file. Written to a temporary file first, so running
+        #  processes never read a half written config
+        with open(CONFIG_PATH + ".tmp", "w") as jsonfile:
             jsonfile.write(self.to_json())
+        os.replace(CONFIG_PATH + ".tmp", CONFIG_PATH)
+        # Apply the change in this process right away, other processes notice the new mtime
+        config_snapshot.check_now()
         return self
 
     def load(self, hide_mnemonic=False):
@@ -96,6 +127,10 @@ class Config(BaseModel):
             self.redis_url = os.getenv("REDIS_URL")
             self.source_info["redis_url"] = "environment variable"
 
+        if "RATE_LIMITING_BACKEND" in os.environ:
+            self.rate_limiting_backend = os.getenv("RATE_LIMITING_BACKEND")
+            self.source_info["rate_limiting_backend"] = "environment variable"
+
         if "GLOBAL_RATE_LIMITS" in os.environ:
             self.global_rate_limits = json.loads(os.getenv("GLOBAL_RATE_LIMITS"))
             self.source_info["global_rate_limits"] = "environment variable"
@@ -107,6 +142,19 @@ class Config(BaseModel):
         if "OPENAI_API_KEY" in os.environ:
             self.openai_api_key = os.getenv("OPENAI_API_KEY")
             self.source_info["openai_api_key"] = "environment variable"
+        if "RESPONSE_CACHE_ENABLED" in os.environ:
+            self.response_cache_enabled = cast_str_to_bool(
+                os.getenv("RESPONSE_CACHE_ENABLED")
+            )
+            self.source_info["response_cache_enabled"] = "environment variable"
+        if "RESPONSE_CACHE_BACKEND" in os.environ:
+            self.response_cache_backend = os.getenv("RESPONSE_CACHE_BACKEND")
+            self.source_info["response_cache_backend"] = "environment variable"
+        if "METAGRAPH_SHARING_ENABLED" in os.environ:
+            self.metagraph_sharing_enabled = cast_str_to_bool(
+                os.getenv("METAGRAPH_SHARING_ENABLED")
+            )
+            self.source_info["metagraph_sharing_enabled"] = "environment variable"
 
         return self
 
@@ -135,3 +183,68 @@ class Config(BaseModel):
     def __str__(self):
         # use __dict__
         return self.to_json()
+
+
+class ConfigSnapshot:
+    """
+    Process-wide Config that is only reloaded when config.json changes.
+
+    get() looks at the mtime, inode and size of the file at most every
+    check_interval seconds. When they changed, a new Config is loaded and
+    swapped in as a whole, and every subscriber is called with the new and the
+    old config. The returned Config is shared, treat it as read-only. To change
+    the config, load a fresh Config() and save() it.
+    """
+
+    def __init__(self, path: str = CONFIG_PATH, check_interval: float = 1):
+        self.path = path
+        self.check_interval = check_interval
+        self.config: Optional[Config] = None
+        self.file_id: Optional[Tuple[int, int, int]] = None
+        self.checked_at = float("-inf")
+        self.subscribers: List[Callable[[Config, Config], None]] = []
+
+    def get(self) -> Config:
+        if self.config is None:
+            self.file_id = self._file_id()
+            self.config = Config().load()
+            self.checked_at = time.monotonic()
+        elif time.monotonic() - self.checked_at >= self.check_interval:
+            self.checked_at = time.monotonic()
+            file_id = self._file_id()
+            if file_id != self.file_id:
+                self._reload(file_id)
+        return self.config
+
+    def check_now(self):
+        """Check the file on the next get(), e.g. after this process saved it."""
+        self.checked_at = float("-inf")
+
+    def subscribe(self, callback: Callable[[Config, Config], None]):
+        """Call callback(new_config, old_config) after every reload."""
+        self.subscribers.append(callback)
+
+    def _file_id(self) -> Optional[Tuple[int, int, int]]:
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+
+    def _reload(self, file_id: Optional[Tuple[int, int, int]]):
+        try:
+            config = Config().load()
+        except (typer.Exit, ValueError):
+            # Keep serving the last good config while the file is being edited
+            logging.warning(f"Could not reload {self.path}, keeping the old config")
+            return
+        old_config, self.config, self.file_id = self.config, config, file_id
+        logging.info(f"Reloaded config from {self.path}")
+        for callback in self.subscribers:
+            try:
+                callback(config, old_config)
+            except Exception as e:
+                logging.warning(f"Config subscriber {callback.__name__} failed: {e!r}")
+
+
+config_snapshot = ConfigSnapshot()
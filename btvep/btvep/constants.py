@@ -5,3 +5,7 @@ DEFAULT_UIDS: Annotated[
 ] = [0]
 DEFAULT_NETUID: Annotated[str, "NETUID to prompt"] = 1
 COST: Annotated[str, "Credit Cost per request"] = 1
+DENDRITE_TIMEOUT: Annotated[float, "Default bittensor dendrite timeout in seconds"] = 12
+DEFAULT_HEDGE_DELAY: Annotated[
+    float, "Seconds to wait before hedging when no latencies have been observed yet"
+] = 2
@@ -12,7 +12,9 @@ from peewee import (
     ForeignKeyField,
 )
 from tabulate import tabulate
+from btvep.api_key_cache import ApiKeyCache, RedisInvalidationChannel
 from btvep.btvep_models import RateLimitEntry
+from btvep.config import Config
 from btvep.db.user import User
 
 from btvep.models.key import ApiKeyInDB
@@ -40,11 +42,20 @@ class ApiKey(BaseModel):
     # default_query_strategy: If nothing is specified in the query, this is used
     # Null - unspecified
     # "top_n" - Top n miners, e.g. "top_n:5"
+    # "fastest_n" - Fastest n miners by observed latency and success rate, e.g. "fastest_n:5"
     # "uids:[CSV of uids]" - Specific UIDS, e.g. "uids:1,2,3"
     default_query_strategy = TextField(null=True)
+    # Whether responses for this key can be served from and stored in the response cache
+    response_cache_enabled = BooleanField(default=True)
     created_at = DateTimeField(default=lambda: int(time.time()))
     updated_at = DateTimeField(default=lambda: int(time.time()))
 
+    def save(self, *args, **kwargs):
+        rows = super().save(*args, **kwargs)
+        # Also drops a cached negative entry when a new key is created
+        invalidate(self.api_key)
+        return rows
+
     def has_unlimited_credits(self):
         return self.credits == -1
 
@@ -100,11 +111,15 @@ def get(query: str | int) -> ApiKey:
 def get_by_key(api_key: str) -> ApiKey:
     try:
         return ApiKey.get((ApiKey.api_key == api_key))
-    except DoesNotExist as error:
-        print(error)
+    except DoesNotExist:
         return None
 
 
+def get_by_key_cached(api_key: str) -> ApiKey:
+    """Same as get_by_key, but served from the in-process API key cache."""
+    return api_key_cache.get(api_key)
+
+
 def get_all() -> list[ApiKeyInDB]:
     return [key for key in ApiKey.select().dicts().order_by(ApiKey.id.desc())]
 
@@ -139,6 +154,7 @@ def update(
     rate_limits: str = None,
     rate_limits_enabled: bool = None,
     default_query_strategy: str = None,
+    response_cache_enabled: bool = None,
     fields_to_nullify: List[str] = None,
 ):
     # Use a dict to filter out None values
@@ -156,6 +172,7 @@ def update(
         else None,
         "rate_limits_enabled": rate_limits_enabled,
         "default_query_strategy": default_query_strategy,
+        "response_cache_enabled": response_cache_enabled,
     }
     # Set fields to None as specified
     if fields_to_nullify:
@@ -175,7 +192,34 @@ def update(
     if user_id is not None:
         criteria &= ApiKey.user_id == user_id
 
-    return q.where(criteria).execute()
+    rows = q.where(criteria).execute()
+    invalidate(query)
+    return rows
+
+
+def increment_usage(
+    query: str | int,
+    api_request_count: int = 0,
+    request_count: int = 0,
+    credits_used: int = 0,
+):
+    """
+    Atomically add to the request counts of an API key and subtract used credits.
+    Unlike update, this is safe for concurrent requests on the same key.
+    """
+    update_dict = {
+        ApiKey.api_request_count: ApiKey.api_request_count + api_request_count,
+        ApiKey.request_count: ApiKey.request_count + request_count,
+        ApiKey.updated_at: int(time.time()),
+    }
+    if credits_used:
+        update_dict[ApiKey.credits] = ApiKey.credits - credits_used
+
+    criteria = (ApiKey.id == query) | (ApiKey.api_key == query)
+    rows = ApiKey.update(update_dict).where(criteria).execute()
+    # Only this process sees the usage right away, other workers pick it up after the TTL
+    api_key_cache.apply_usage(query, api_request_count, request_count, credits_used)
+    return rows
 
 
 def delete(id_or_key: str | int, user_id: str = None):
@@ -193,4 +237,31 @@ def delete(id_or_key: str | int, user_id: str = None):
     if user_id is not None:
         criteria &= ApiKey.user_id == user_id
 
-    return q.where(criteria).execute()
+    rows = q.where(criteria).execute()
+    invalidate(id_or_key)
+    return rows
+
+
+def invalidate(query: str | int | None = None):
+    """
+    Drop an API key from the cache by id or key, or all keys if query is None.
+    Other processes are notified too if Redis invalidation is enabled.
+    """
+    api_key_cache.invalidate(query)
+    if invalidation_channel is not None:
+        invalidation_channel.publish(query)
+
+
+config = Config().load()
+
+api_key_cache = ApiKeyCache(
+    get_by_key,
+    ttl_seconds=int(config.api_key_cache_ttl_seconds),
+    max_entries=int(config.api_key_cache_max_entries),
+    max_negative_entries=int(config.api_key_cache_max_negative_entries),
+)
+invalidation_channel = (
+    RedisInvalidationChannel(config.redis_url)
+    if config.api_key_cache_redis_invalidation_enabled
+    else None
+)
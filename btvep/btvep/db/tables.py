@@ -1,6 +1,24 @@
+from playhouse.migrate import SqliteMigrator, migrate
+
 from .utils import db
 from .api_keys import ApiKey
 
 
+def add_missing_columns(model):
+    """Add columns that were added to a model after its table was created."""
+    existing_columns = {
+        column.name for column in db.get_columns(model._meta.table_name)
+    }
+    migrator = SqliteMigrator(db)
+    operations = [
+        migrator.add_column(model._meta.table_name, field.column_name, field)
+        for field in model._meta.sorted_fields
+        if field.column_name not in existing_columns
+    ]
+    if operations:
+        migrate(*operations)
+
+
 def create_all():
     db.create_tables([ApiKey])
+    add_missing_columns(ApiKey)
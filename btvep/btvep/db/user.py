@@ -1,9 +1,13 @@
 import json
 import time
+from typing import Tuple
 
 from peewee import BooleanField, DateTimeField, IntegerField, TextField
 from tabulate import tabulate
 
+from btvep.config import Config
+from btvep.ttl_cache import TTLCache
+
 from .utils import BaseModel, db
 
 
@@ -18,6 +22,11 @@ class User(BaseModel):
     created_at = DateTimeField(default=lambda: int(time.time()))
     updated_at = DateTimeField(default=lambda: int(time.time()))
 
+    def save(self, *args, **kwargs):
+        rows = super().save(*args, **kwargs)
+        user_cache.invalidate(self.id)
+        return rows
+
     def __str__(self):
         return json.dumps(self.__dict__["__data__"], indent=4, default=str)
 
@@ -30,4 +39,31 @@ class User(BaseModel):
         )
 
 
+class UserCache:
+    """
+    Users by id, so authenticated requests don't query the database every time.
+    Changes made by another process (e.g. btvep user edit) apply after ttl_seconds.
+    """
+
+    def __init__(self, ttl_seconds: float, max_entries: int = 10_000):
+        # user id -> user
+        self.entries = TTLCache(max_entries, ttl_seconds)
+
+    def get_or_create(self, user_id: str) -> Tuple[User, bool]:
+        user = self.entries.get(user_id)
+        if user is not None:
+            return user, False
+        user, created = User.get_or_create(id=user_id)
+        self.entries.set(user_id, user)
+        return user, created
+
+    def invalidate(self, user_id: str | None = None):
+        if user_id is None:
+            self.entries.clear()
+        else:
+            self.entries.pop(user_id)
+
+
+user_cache = UserCache(int(Config().load().user_cache_ttl_seconds))
+
 db.create_tables([User])
@@ -1,38 +1,271 @@
+import asyncio
 import concurrent.futures
+import hashlib
+import json
 import logging
-from typing import List
+import re
+from typing import Callable, List, Optional, Tuple
+
+from btvep.ttl_cache import TTLCache
+
+
+class VerdictCache:
+    """
+    Moderation verdicts by a hash of the content, so contents that are sent
+    over and over (e.g. system prompts) are only moderated once per ttl_seconds.
+    """
+
+    def __init__(self, ttl_seconds: float = 3600, max_entries: int = 10_000):
+        self.ttl_seconds = ttl_seconds
+        # content hash -> flagged
+        self.entries = TTLCache(max_entries, ttl_seconds)
+
+    @staticmethod
+    def _hash(content) -> str:
+        return hashlib.sha256(json.dumps(content).encode()).hexdigest()
+
+    def get(self, content) -> Optional[bool]:
+        return self.entries.get(self._hash(content))
+
+    def set(self, content, flagged: bool):
+        if self.ttl_seconds <= 0:
+            return
+        self.entries.set(self._hash(content), flagged)
+
+
+class ModerationBatcher:
+    """
+    Collects the contents of concurrent requests for up to max_wait_seconds and
+    moderates them with a single call to check, with at most max_batch_size
+    contents per call. Every caller gets back the flags of its own contents.
+    """
+
+    def __init__(
+        self,
+        check: Callable[[List[str]], dict],
+        executor: concurrent.futures.Executor,
+        max_batch_size: int = 32,
+        max_wait_seconds: float = 0.005,
+    ):
+        self.check_batch = check
+        self.executor = executor
+        self.max_batch_size = max_batch_size
+        self.max_wait_seconds = max_wait_seconds
+        # (contents, future of the caller) in arrival order
+        self.pending: List[Tuple[list, asyncio.Future]] = []
+        self.pending_size = 0
+        self.flush_handle: Optional[asyncio.TimerHandle] = None
+        self.tasks = set()
+
+    async def check(self, contents: list) -> dict:
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self.pending.append((contents, future))
+        self.pending_size += len(contents)
+        if self.pending_size >= self.max_batch_size:
+            self._flush()
+        elif self.flush_handle is None:
+            self.flush_handle = loop.call_later(self.max_wait_seconds, self._flush)
+        return await future
+
+    def _flush(self):
+        if self.flush_handle is not None:
+            self.flush_handle.cancel()
+            self.flush_handle = None
+        while self.pending:
+            batch, size = [], 0
+            while self.pending and (
+                not batch or size + len(self.pending[0][0]) <= self.max_batch_size
+            ):
+                contents, future = self.pending.pop(0)
+                self.pending_size -= len(contents)
+                # Callers that timed out while waiting are not sent
+                if not future.done():
+                    batch.append((contents, future))
+                    size += len(contents)
+            if batch:
+                task = asyncio.create_task(self._send(batch))
+                self.tasks.add(task)
+                task.add_done_callback(self.tasks.discard)
+
+    async def _send(self, batch: List[Tuple[list, asyncio.Future]]):
+        # Contents shared by several requests (e.g. system prompts) are sent once
+        unique = {
+            json.dumps(content): content
+            for contents, _ in batch
+            for content in contents
+        }
+        try:
+            output = await asyncio.wrap_future(
+                self.executor.submit(self.check_batch, list(unique.values()))
+            )
+        except BaseException as e:
+            # Callers must not wait until they time out, not even if the call
+            # was cancelled (e.g. by shutting down the executor)
+            error = (
+                e
+                if isinstance(e, Exception)
+                else RuntimeError(f"Moderation call was cancelled: {e!r}")
+            )
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(error)
+            if not isinstance(e, Exception):
+                raise
+            return
+        flags = dict(zip(unique, output["flagged"]))
+        for contents, future in batch:
+            if not future.done():
+                flagged = [flags[json.dumps(content)] for content in contents]
+                future.set_result(
+                    {
+                        "response": output["response"],
+                        "flagged": flagged,
+                        "any_flagged": any(flagged),
+                    }
+                )
 
 
 class Filter:
-    def safe_check(self, input: str, timeout_seconds: int = 5):
+    """
+    Moderation runs on a bounded thread pool shared by all requests, so a slow
+    moderation call never blocks the event loop or piles up threads. Contents
+    of concurrent requests are sent together, see ModerationBatcher.
+    """
+
+    def __init__(
+        self,
+        timeout_seconds: float = 5,
+        max_concurrency: int = 8,
+        verdicts: VerdictCache | None = None,
+        max_batch_size: int = 32,
+        max_batch_wait_seconds: float = 0.005,
+    ):
+        self.timeout_seconds = timeout_seconds
+        self.executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=max_concurrency, thread_name_prefix="moderation"
+        )
+        self.verdicts = verdicts or VerdictCache()
+        self.batcher = ModerationBatcher(
+            self.check,
+            self.executor,
+            max_batch_size=max_batch_size,
+            max_wait_seconds=max_batch_wait_seconds,
+        )
+
+    async def safe_check(self, input: List[str], timeout_seconds: float = None):
         """If moderation request takes longer than timeout, simply allow it."""
-        with concurrent.futures.ThreadPoolExecutor() as executor:
-            future = executor.submit(self.check, input)
-            try:
-                output = future.result(timeout=timeout_seconds)
-                return output
-            except concurrent.futures.TimeoutError:
-                logging.warning("OpenAI filter timed out. Allowing request.")
-                return {
-                    "response": None,
-                    "any_flagged": False,
-                }
+        if timeout_seconds is None:
+            timeout_seconds = self.timeout_seconds
+        cached = [self.verdicts.get(content) for content in input]
+        if any(cached):
+            return {"response": None, "any_flagged": True}
+        # Contents are sent once, even if they appear in several messages
+        unchecked = list(
+            {
+                json.dumps(content): content
+                for content, flagged in zip(input, cached)
+                if flagged is None
+            }.values()
+        )
+        if not unchecked:
+            return {"response": None, "any_flagged": False}
+
+        try:
+            # Cancelling also drops the contents if their batch wasn't sent yet
+            output = await asyncio.wait_for(
+                self.batcher.check(unchecked), timeout=timeout_seconds
+            )
+        except asyncio.TimeoutError:
+            logging.warning("OpenAI filter timed out. Allowing request.")
+            return {
+                "response": None,
+                "any_flagged": False,
+            }
+        for content, flagged in zip(unchecked, output["flagged"]):
+            self.verdicts.set(content, flagged)
+        return output
 
     def check(self, input: str | List[str]):
+        """Returns the response, a flagged boolean per input and any_flagged."""
         raise NotImplementedError
 
+    def close(self):
+        """Moderation calls that were already submitted still finish."""
+        self.executor.shutdown(wait=False)
+
+
+class LocalFilter:
+    """
+    Moderation stage that runs in process before the remote filter.
+
+    Contents matching a blocklist entry (case-insensitive whole words or
+    phrases) are flagged right away. Contents on the allowlist (exact matches,
+    e.g. known system prompts) are trusted and not sent to the remote filter.
+    All blocklist entries are compiled into a single regex, so a content is
+    scanned once no matter how long the blocklist is.
+    """
+
+    def __init__(self, blocklist: List[str] = (), allowlist: List[str] = ()):
+        # Longest first, so a phrase wins over a keyword it starts with
+        keywords = sorted(
+            {k.strip() for k in blocklist if k.strip()}, key=len, reverse=True
+        )
+        self.pattern = (
+            re.compile(
+                r"(?<!\w)(?:" + "|".join(map(re.escape, keywords)) + r")(?!\w)",
+                re.IGNORECASE,
+            )
+            if keywords
+            else None
+        )
+        self.allowlist = set(allowlist)
+
+    def check(self, input: List[str]):
+        """Returns the matched blocklist entries, any_flagged and the contents left to check remotely."""
+        matches = []
+        unchecked = []
+        for content in input:
+            if not isinstance(content, str):
+                unchecked.append(content)
+                continue
+            if self.pattern is not None:
+                match = self.pattern.search(content)
+                if match is not None:
+                    matches.append(match.group(0))
+                    continue
+            if content not in self.allowlist:
+                unchecked.append(content)
+        return {
+            "matches": matches,
+            "any_flagged": len(matches) > 0,
+            "unchecked": unchecked,
+        }
+
 
 import openai
 
 
 class OpenAIFilter(Filter):
-    def __init__(self, api_key):
+    def __init__(self, api_key, api_base: str | None = None, **kwargs):
+        super().__init__(**kwargs)
         self.api_key = api_key
+        self.api_base = api_base
 
     def check(self, input: str | List[str]):
-        response = openai.Moderation.create(input=input, api_key=self.api_key)
+        # Same as openai.Moderation.create, but with an optional api_base
+        moderation = openai.Moderation(api_key=self.api_key, api_base=self.api_base)
+        response = moderation.request(
+            "post",
+            openai.Moderation.get_url(),
+            {"input": input},
+            # Don't hold a pool thread much longer than callers wait for it
+            request_timeout=self.timeout_seconds * 2,
+        )
+        # Results include a flagged boolean for each input, look at all of them
+        flagged = [result["flagged"] for result in response["results"]]
         return {
             "response": response,
-            # Results include a flagged boolean for each input, look at all of them
-            "any_flagged": any([result["flagged"] for result in response["results"]]),
+            "flagged": flagged,
+            "any_flagged": any(flagged),
         }
@@ -0,0 +1,153 @@
+import asyncio
+import hashlib
+import json
+import logging
+import time
+import urllib.request
+from typing import Callable, Dict, Optional
+
+import jwt
+
+from btvep.ttl_cache import TTLCache
+
+
+def fetch_json(url: str, timeout: float = 10) -> dict:
+    with urllib.request.urlopen(url, timeout=timeout) as response:
+        return json.load(response)
+
+
+class JwksCache:
+    """
+    Process-wide cache of the JSON Web Key Set used to verify user tokens.
+
+    The key set is fetched on first use and refreshed in the background every
+    refresh_seconds. A token signed with an unknown kid (e.g. after the auth
+    provider rotated its keys) triggers a refetch, at most once every
+    min_refetch_seconds so tokens with made up kids can't flood the provider.
+    """
+
+    def __init__(
+        self,
+        jwks_url: str,
+        refresh_seconds: float = 600,
+        min_refetch_seconds: float = 30,
+        fetch_jwks: Callable[[str], dict] = fetch_json,
+    ):
+        self.jwks_url = jwks_url
+        self.refresh_seconds = refresh_seconds
+        self.min_refetch_seconds = min_refetch_seconds
+        self.fetch_jwks = fetch_jwks
+        self.keys: Optional[Dict[str, jwt.PyJWK]] = None
+        self.fetched_at: Optional[float] = None
+        self.refresh_task: Optional[asyncio.Task] = None
+        self.lock = asyncio.Lock()
+
+    async def get_signing_key(self, kid: str) -> jwt.PyJWK:
+        if self.refresh_task is None:
+            self.refresh_task = asyncio.create_task(self._refresh_loop())
+        if self.keys is None:
+            await self.refresh()
+        key = self.keys.get(kid)
+        if key is None:
+            await self.refresh(min_age=self.min_refetch_seconds)
+            key = self.keys.get(kid)
+        if key is None:
+            raise jwt.exceptions.PyJWKClientError(
+                f'Unable to find a signing key that matches: "{kid}"'
+            )
+        return key
+
+    async def refresh(self, min_age: float = 0):
+        """Refetch the key set, unless it was fetched less than min_age seconds ago."""
+        async with self.lock:
+            # Concurrent callers share the fetch of whoever got the lock first
+            if self.fetched_at is not None and self.age_seconds < min_age:
+                return
+            try:
+                jwks = await asyncio.to_thread(self.fetch_jwks, self.jwks_url)
+                key_set = jwt.PyJWKSet.from_dict(jwks)
+            except Exception as e:
+                raise jwt.exceptions.PyJWKClientError(
+                    f'Fail to fetch data from the url, err: "{e}"'
+                )
+            finally:
+                # Failed fetches also count, to keep retries rate limited
+                self.fetched_at = time.monotonic()
+            self.keys = {key.key_id: key for key in key_set.keys}
+
+    @property
+    def age_seconds(self) -> float:
+        return time.monotonic() - self.fetched_at
+
+    def close(self):
+        """Stop refreshing the key set in the background."""
+        if self.refresh_task is not None:
+            self.refresh_task.cancel()
+
+    async def _refresh_loop(self):
+        while True:
+            await asyncio.sleep(self.refresh_seconds)
+            try:
+                await self.refresh()
+            except jwt.exceptions.PyJWKClientError as e:
+                logging.warning(f"Could not refresh JWKS, keeping the old keys: {e}")
+
+
+class VerifiedTokenCache:
+    """
+    Claims of tokens that passed verification, keyed by a hash of the token.
+    Entries expire with the token (exp) or after ttl_seconds, whichever is first.
+    """
+
+    def __init__(self, max_entries: int = 10_000, ttl_seconds: float = 300):
+        # token hash -> claims, on the wall clock to compare with exp
+        self.entries = TTLCache(max_entries, ttl_seconds, clock=time.time)
+
+    @staticmethod
+    def _hash(token: str) -> str:
+        return hashlib.sha256(token.encode()).hexdigest()
+
+    def get(self, token: str) -> Optional[dict]:
+        return self.entries.get(self._hash(token))
+
+    def set(self, token: str, claims: dict):
+        self.entries.set(self._hash(token), claims, expires_at=claims.get("exp"))
+
+
+class TokenVerifier:
+    """Verifies RS256 user tokens against the cached JWKS of the auth provider."""
+
+    def __init__(
+        self,
+        jwks: JwksCache,
+        audience: str | None,
+        issuer: str | None,
+        verified_tokens: VerifiedTokenCache | None = None,
+    ):
+        self.jwks = jwks
+        self.audience = audience
+        self.issuer = issuer
+        self.verified_tokens = verified_tokens or VerifiedTokenCache()
+
+    async def verify(self, token: str) -> dict:
+        """
+        Returns the claims of the token. Raises PyJWKClientError if there is no
+        matching signing key and a PyJWTError if the token is invalid.
+        """
+        claims = self.verified_tokens.get(token)
+        if claims is not None:
+            return claims
+        kid = jwt.get_unverified_header(token).get("kid")
+        signing_key = await self.jwks.get_signing_key(kid)
+        claims = jwt.decode(
+            token,
+            signing_key.key,
+            algorithms="RS256",
+            audience=self.audience,
+            issuer=self.issuer,
+        )
+        self.verified_tokens.set(token, claims)
+        return claims
+
+    def close(self):
+        self.jwks.close()
@@ -1,54 +1,448 @@
+import asyncio
+import fcntl
+import json
 import logging
+import mmap
+import os
+import random
+import struct
+import sys
 import time
-from typing import Optional
+from typing import Callable, Dict, Iterable, Optional, Sequence, Tuple
+
 import bittensor
+import numpy as np
+
+SNAPSHOT_DIR = os.path.join(os.path.dirname(__file__), "../../metagraph_snapshots")
+SNAPSHOT_DIR = os.path.abspath(SNAPSHOT_DIR)
+
+
+class CompactMetagraph:
+    """
+    Struct of arrays copy of the parts of the metagraph that the endpoint uses:
+    hotkeys, axon ip/port and incentive, indexed by uid. It is kept instead of
+    bittensor.metagraph, which also holds every neuron and a dozen torch tensors
+    that requests never look at.
+
+    It can be saved to disk after a sync and loaded back on startup, so requests
+    can be served right away while a fresh sync runs in the background.
+    """
+
+    # Layout of a snapshot on disk
+    dtype = np.dtype(
+        [
+            ("hotkey", "U48"),
+            ("ip", "U39"),
+            ("port", np.int32),
+            ("ip_type", np.int8),
+            ("incentive", np.float32),
+        ]
+    )
+
+    def __init__(
+        self,
+        netuid: int,
+        hotkeys: Iterable[str],
+        ips: Iterable[str],
+        ports: np.ndarray,
+        ip_types: np.ndarray,
+        incentive: np.ndarray,
+        block: int,
+        timestamp: float,
+    ):
+        self.netuid = netuid
+        self.block = block
+        self.timestamp = timestamp
+        # Columns of a memory mapped snapshot are used in place, so all workers
+        # that load the same snapshot share its pages instead of copying them.
+        # Otherwise hotkeys and the many 0.0.0.0 ips of axons that are not
+        # serving are interned, so equal strings are only stored once.
+        self.hotkeys: Sequence[str] = (
+            hotkeys
+            if isinstance(hotkeys, np.ndarray)
+            else [sys.intern(hotkey) for hotkey in hotkeys]
+        )
+        self.ips: Sequence[str] = (
+            ips if isinstance(ips, np.ndarray) else [sys.intern(ip) for ip in ips]
+        )
+        self.ports = np.asarray(ports, dtype=np.int32)
+        self.ip_types = np.asarray(ip_types, dtype=np.int8)
+        self.incentive = np.asarray(incentive, dtype=np.float32)
+
+    def __len__(self):
+        return len(self.hotkeys)
+
+    def axon(self, uid: int) -> bittensor.AxonInfo:
+        """AxonInfo of the uid, built on demand for the dendrite."""
+        return bittensor.AxonInfo(
+            version=0,
+            ip=self.ips[uid],
+            port=int(self.ports[uid]),
+            ip_type=int(self.ip_types[uid]),
+            hotkey=self.hotkeys[uid],
+            coldkey="",
+        )
+
+    @classmethod
+    def from_metagraph(cls, netuid: int, metagraph: bittensor.metagraph):
+        axons = metagraph.axons
+        return cls(
+            netuid,
+            hotkeys=[axon.hotkey for axon in axons],
+            ips=[axon.ip for axon in axons],
+            ports=[axon.port for axon in axons],
+            ip_types=[axon.ip_type for axon in axons],
+            incentive=metagraph.incentive.numpy(),
+            block=int(metagraph.block),
+            timestamp=time.time(),
+        )
+
+    @staticmethod
+    def _paths(directory: str, netuid: int):
+        base = os.path.join(directory, f"metagraph-{netuid}")
+        return base + ".npy", base + ".json"
+
+    def save(self, directory: str):
+        """Atomically write the snapshot, the metadata file is written last."""
+        os.makedirs(directory, exist_ok=True)
+        neurons = np.zeros(len(self), dtype=self.dtype)
+        neurons["hotkey"] = self.hotkeys
+        neurons["ip"] = self.ips
+        neurons["port"] = self.ports
+        neurons["ip_type"] = self.ip_types
+        neurons["incentive"] = self.incentive
+
+        neurons_path, meta_path = self._paths(directory, self.netuid)
+        with open(neurons_path + ".tmp", "wb") as f:
+            np.save(f, neurons)
+        os.replace(neurons_path + ".tmp", neurons_path)
+        meta = {"netuid": self.netuid, "block": self.block, "timestamp": self.timestamp}
+        with open(meta_path + ".tmp", "w") as f:
+            json.dump(meta, f)
+        os.replace(meta_path + ".tmp", meta_path)
+
+    @classmethod
+    def load(cls, directory: str, netuid: int) -> Optional["CompactMetagraph"]:
+        """Memory map a saved snapshot. Returns None if there is no usable snapshot."""
+        neurons_path, meta_path = cls._paths(directory, netuid)
+        try:
+            with open(meta_path) as f:
+                meta = json.load(f)
+            neurons = np.load(neurons_path, mmap_mode="r")
+        except (OSError, ValueError) as e:
+            logging.info(f"No usable metagraph snapshot in {directory}: {e}")
+            return None
+        if neurons.dtype != cls.dtype or meta.get("netuid") != netuid:
+            return None
+        return cls(
+            netuid,
+            hotkeys=neurons["hotkey"],
+            ips=neurons["ip"],
+            ports=neurons["port"],
+            ip_types=neurons["ip_type"],
+            incentive=neurons["incentive"],
+            block=meta.get("block", 0),
+            timestamp=meta["timestamp"],
+        )
+
+    @property
+    def age_seconds(self) -> float:
+        return time.time() - self.timestamp
+
+
+class MetagraphIndex:
+    """
+    Immutable lookup structures derived from a metagraph, built once per sync so
+    requests don't have to sort or scan the metagraph themselves.
+
+    - ranked_uids: uids of serving axons, ordered by incentive (highest first)
+    - serving: mask of uids whose axon has an ip and port set
+    - hotkey_to_uid: uid of every registered hotkey
+    """
+
+    def __init__(self, metagraph: CompactMetagraph):
+        self.hotkeys = metagraph.hotkeys
+        self.axon = metagraph.axon
+        self.serving = (np.asarray(metagraph.ips) != "0.0.0.0") & (metagraph.ports != 0)
+        self.serving.flags.writeable = False
+        ranked = np.argsort(-metagraph.incentive, kind="stable")
+        self.ranked_uids: Tuple[int, ...] = tuple(
+            int(uid) for uid in ranked if self.serving[uid]
+        )
+        self.hotkey_to_uid: Dict[str, int] = {
+            hotkey: uid for uid, hotkey in enumerate(self.hotkeys)
+        }
+
+    def __len__(self):
+        return len(self.hotkeys)
+
+
+class SyncLeaderLock:
+    """
+    Non blocking exclusive file lock. The worker holding it syncs the metagraph
+    for all workers. The lock is released by the OS if that worker dies, so
+    another worker can take over.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.file = None
+
+    def try_acquire(self) -> bool:
+        if self.file is not None:
+            return True
+        file = open(self.path, "a")
+        try:
+            fcntl.flock(file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            file.close()
+            return False
+        self.file = file
+        return True
+
+
+class GenerationCounter:
+    """
+    64 bit counter in a memory mapped file, incremented by the sync leader every
+    time it publishes a new metagraph snapshot.
+    """
+
+    def __init__(self, path: str):
+        with open(path, "a+b") as f:
+            if os.fstat(f.fileno()).st_size < 8:
+                f.truncate(8)
+            self.mmap = mmap.mmap(f.fileno(), 8)
+
+    def get(self) -> int:
+        return struct.unpack_from("<Q", self.mmap)[0]
+
+    def increment(self) -> int:
+        generation = self.get() + 1
+        struct.pack_into("<Q", self.mmap, 0, generation)
+        return generation
 
 
 class MetagraphSyncer:
+    """
+    Keeps the metagraph of a subnet in sync in an asyncio background task.
+
+    A single subtensor connection is reused between syncs. After a failed sync
+    the connection is dropped and retried with exponential backoff and jitter.
+
+    If shared is set, only the worker holding the sync leader lock syncs with
+    the chain. It publishes every sync as a snapshot in snapshot_dir and bumps
+    the generation counter, the other workers memory map each new generation
+    read-only.
+    """
+
     def __init__(
-        self, netuid: int, rest_seconds: int = 60, extra_fail_rest_seconds: int = 60
+        self,
+        netuid: int,
+        rest_seconds: int = 60,
+        backoff_base_seconds: float = 5,
+        backoff_max_seconds: float = 300,
+        snapshot_dir: str | None = SNAPSHOT_DIR,
+        snapshot_max_staleness_seconds: int = 3600,
+        shared: bool = False,
+        follower_poll_seconds: float = 1,
+        subtensor_factory: Callable[[], bittensor.subtensor] = bittensor.subtensor,
     ):
-        self.last_sync_success = None
+        if shared and snapshot_dir is None:
+            raise ValueError("A snapshot_dir is required to share the metagraph")
         self.netuid = netuid
-        self.is_syncing = False
         self.rest_seconds = rest_seconds
-        self.extra_fail_rest_seconds = extra_fail_rest_seconds
-        self.metagraph: Optional[bittensor.metagraph] = None
+        self.backoff_base_seconds = backoff_base_seconds
+        self.backoff_max_seconds = backoff_max_seconds
+        self.subtensor_factory = subtensor_factory
+        self.subtensor: Optional[bittensor.subtensor] = None
+        self.task: Optional[asyncio.Task] = None
 
-    def sync(self):
-        subtensor = bittensor.subtensor()
-        self.is_syncing = True
-        try:
-            sync_start = time.time()
-            metagraph: bittensor.metagraph = subtensor.metagraph(netuid=self.netuid)
-            self.metagraph = metagraph
-            self.last_sync_success = time.time()
+        # Health of the sync loop
+        self.is_syncing = False
+        self.last_sync_success: Optional[float] = None
+        self.last_sync_duration: Optional[float] = None
+        self.last_sync_error: Optional[str] = None
+        self.consecutive_failures = 0
+
+        # Set snapshot_dir to None to disable snapshots
+        self.snapshot_dir = snapshot_dir
+        self.snapshot_max_staleness_seconds = snapshot_max_staleness_seconds
+        self.metagraph: Optional[CompactMetagraph] = None
+        # Replaced as a whole after every sync, readers should grab it once per request
+        self.index: Optional[MetagraphIndex] = None
+
+        self.shared = shared
+        self.follower_poll_seconds = follower_poll_seconds
+        self.leader_lock: Optional[SyncLeaderLock] = None
+        self.generation: Optional[GenerationCounter] = None
+        self.loaded_generation: Optional[int] = None
+        if shared:
+            os.makedirs(snapshot_dir, exist_ok=True)
+            base = os.path.join(snapshot_dir, f"metagraph-{netuid}")
+            self.leader_lock = SyncLeaderLock(base + ".lock")
+            self.generation = GenerationCounter(base + ".generation")
+
+    def is_leader(self) -> bool:
+        """Whether this worker syncs with the chain. Takes over the lock if it is free."""
+        if not self.shared:
+            return True
+        was_leader = self.leader_lock.file is not None
+        is_leader = self.leader_lock.try_acquire()
+        if is_leader and not was_leader:
+            logging.info(f"Became metagraph sync leader (pid {os.getpid()})")
+        return is_leader
+
+    def follow(self) -> Optional[CompactMetagraph]:
+        """Map the snapshot of the leader if a new generation has been published."""
+        generation = self.generation.get()
+        if generation == 0 or generation == self.loaded_generation:
+            return None
+        snapshot = CompactMetagraph.load(self.snapshot_dir, self.netuid)
+        if snapshot is None:
+            return None
+        # The counter outlives restarts, so the generation may be left over
+        # from a leader that is gone. Wait for the next one if it's too stale.
+        if snapshot.age_seconds > self.snapshot_max_staleness_seconds:
+            logging.info(
+                f"Ignoring metagraph generation {generation} for netuid {self.netuid}, it is {snapshot.age_seconds:.0f} seconds old"
+            )
+            self.loaded_generation = generation
+            return None
+        self.index = MetagraphIndex(snapshot)
+        self.metagraph = snapshot
+        self.last_sync_success = snapshot.timestamp
+        self.loaded_generation = generation
+        logging.info(
+            f"Loaded metagraph generation {generation} for netuid {self.netuid} from the sync leader"
+        )
+        return snapshot
+
+    def load_snapshot(self) -> Optional[CompactMetagraph]:
+        """Load the last saved snapshot if it exists and is not too stale."""
+        if self.snapshot_dir is None:
+            return None
+        snapshot = CompactMetagraph.load(self.snapshot_dir, self.netuid)
+        if snapshot is None:
+            return None
+        if snapshot.age_seconds > self.snapshot_max_staleness_seconds:
             logging.info(
-                f"Synced metagraph for netuid {self.netuid} (took {self.last_sync_success - sync_start:.2f} seconds)",
+                f"Ignoring metagraph snapshot for netuid {self.netuid}, it is {snapshot.age_seconds:.0f} seconds old"
             )
-            return metagraph
+            return None
+        # Don't overwrite a metagraph that was synced in the meantime
+        if self.metagraph is None:
+            self.index = MetagraphIndex(snapshot)
+            self.metagraph = snapshot
+            self.last_sync_success = snapshot.timestamp
+            logging.info(
+                f"Loaded metagraph snapshot for netuid {self.netuid} ({snapshot.age_seconds:.0f} seconds old)"
+            )
+        return snapshot
+
+    def save_snapshot(self, metagraph: CompactMetagraph) -> bool:
+        if self.snapshot_dir is None:
+            return False
+        try:
+            metagraph.save(self.snapshot_dir)
+            return True
         except Exception as e:
-            logging.warning("Could not sync metagraph: ", e)
-            raise e  # Reraise the exception to be handled by the caller
+            logging.warning(f"Could not save metagraph snapshot: {e}")
+            return False
+
+    def _fetch(self) -> Tuple[CompactMetagraph, MetagraphIndex]:
+        """Blocking part of a sync, runs in a worker thread."""
+        if self.subtensor is None:
+            self.subtensor = self.subtensor_factory()
+        # Only the compact view is kept, the full bittensor metagraph is released here
+        metagraph = CompactMetagraph.from_metagraph(
+            self.netuid, self.subtensor.metagraph(netuid=self.netuid)
+        )
+        return metagraph, MetagraphIndex(metagraph)
+
+    async def sync(self) -> CompactMetagraph:
+        self.is_syncing = True
+        sync_start = time.monotonic()
+        try:
+            metagraph, index = await asyncio.to_thread(self._fetch)
+        except Exception as e:
+            self.consecutive_failures += 1
+            self.last_sync_error = repr(e)
+            # Reconnect on the next attempt, in case the connection is what failed
+            self.subtensor = None
+            logging.warning(
+                f"Could not sync metagraph for netuid {self.netuid} ({self.consecutive_failures} consecutive failures): {e!r}"
+            )
+            raise
         finally:
             self.is_syncing = False
-            return None
+            self.last_sync_duration = time.monotonic() - sync_start
 
-    def start_sync_thread(self):
+        self.index = index
+        self.metagraph = metagraph
         self.last_sync_success = time.time()
+        self.last_sync_error = None
+        self.consecutive_failures = 0
+        logging.info(
+            f"Synced metagraph for netuid {self.netuid} (took {self.last_sync_duration:.2f} seconds)",
+        )
+        if await asyncio.to_thread(self.save_snapshot, metagraph) and self.shared:
+            self.loaded_generation = self.generation.increment()
+        return metagraph
 
-        # Run in a separate thread
-        def loop():
-            while True:
+    def next_delay(self) -> float:
+        """Seconds to wait before the next sync."""
+        if self.consecutive_failures == 0:
+            return self.rest_seconds
+        backoff = min(
+            self.backoff_max_seconds,
+            self.backoff_base_seconds * 2 ** (self.consecutive_failures - 1),
+        )
+        # Jitter, so restarted workers don't all retry at the same moment
+        return random.uniform(backoff / 2, backoff)
+
+    async def run(self):
+        while True:
+            if not self.is_leader():
                 try:
-                    self.sync()
+                    await asyncio.to_thread(self.follow)
                 except Exception as e:
-                    time.sleep(self.extra_fail_rest_seconds)
-                time.sleep(self.rest_seconds)
+                    logging.warning(f"Could not load shared metagraph: {e!r}")
+                await asyncio.sleep(self.follower_poll_seconds)
+                continue
+            try:
+                await self.sync()
+            except Exception:
+                pass  # Logged and counted by sync, retried after the backoff
+            await asyncio.sleep(self.next_delay())
+
+    def start(self) -> asyncio.Task:
+        """Start syncing in the background. Must be called from a running event loop."""
+        # Serve requests from the last snapshot until the first sync is done
+        self.load_snapshot()
+        self.task = asyncio.get_running_loop().create_task(self.run())
+        logging.info("Started metagraph sync task")
+        return self.task
 
-        import threading
+    async def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+            await asyncio.gather(self.task, return_exceptions=True)
+            self.task = None
 
-        thread = threading.Thread(target=loop, daemon=True)
-        thread.start()
-        logging.info("Started metagraph sync thread")
-        return thread
+    def health(self) -> dict:
+        return {
+            "netuid": self.netuid,
+            "synced": self.index is not None,
+            "block": self.metagraph.block if self.metagraph is not None else None,
+            "last_sync_success": self.last_sync_success,
+            "seconds_since_last_sync": time.time() - self.last_sync_success
+            if self.last_sync_success is not None
+            else None,
+            "last_sync_duration": self.last_sync_duration,
+            "last_sync_error": self.last_sync_error,
+            "consecutive_failures": self.consecutive_failures,
+            "is_syncing": self.is_syncing,
+            "shared": self.shared,
+            "is_leader": not self.shared or self.leader_lock.file is not None,
+            "generation": self.loaded_generation,
+        }
@@ -22,6 +22,7 @@ class ApiKeyInDB(BaseModel):
     rate_limits: Optional[str] = None
     rate_limits_enabled: bool = None
     default_query_strategy: Optional[str] = None
+    response_cache_enabled: bool = True
     created_at: int
     updated_at: int
 
@@ -1,6 +1,7 @@
 import bittensor as bt
 import pydantic
-from typing import List
+from dataclasses import dataclass
+from typing import List, Optional
 
 
 class Prompting(bt.Synapse):
@@ -105,6 +106,31 @@ class Prompting(bt.Synapse):
         description="A list of required fields for the hash.",
         allow_mutation=False,
     )
+
+    # Cached body hash, see body_hash
+    _body_hash: Optional[str] = pydantic.PrivateAttr(None)
+
+    @property
+    def body_hash(self) -> str:
+        """
+        The hashed fields are immutable, so the hash is only computed once per synapse.
+        Copies made with copy() share the cached hash, which lets one synapse be
+        hashed once and then sent to many axons.
+
+        Only assignment is blocked: changing a hashed list in place, such as
+        messages.append(), after the first access leaves the cached hash stale.
+        """
+        if self._body_hash is None:
+            self._body_hash = super().body_hash
+        return self._body_hash
+
+    def copy(self, *, update=None, **kwargs) -> "Prompting":
+        copy = super().copy(update=update, **kwargs)
+        if update:
+            # update skips allow_mutation, it may have changed a hashed field
+            copy._body_hash = None
+        return copy
+
     is_completion: bool = False
     dest_hotkey: str = ""
     return_message: str = ""
@@ -112,3 +138,22 @@ class Prompting(bt.Synapse):
     src_version: int = bt.__version_as_int__
     dest_version: int = None
     return_code: int = None
+
+
+@dataclass
+class PromptingResult:
+    """
+    Result of prompting a single miner.
+
+    Kept separate from Prompting so that setting the result fields does not
+    trigger pydantic validation for every miner.
+    """
+
+    completion: str
+    is_completion: bool
+    elapsed: float
+    dest_hotkey: str
+    return_code: Optional[int]
+    return_message: Optional[str]
+    src_version: Optional[int]
+    dest_version: Optional[int]
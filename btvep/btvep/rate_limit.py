@@ -0,0 +1,289 @@
+import time
+from math import ceil
+from typing import Any, Awaitable, Callable, List
+
+from fastapi_limiter import FastAPILimiter
+from starlette.requests import Request
+from starlette.responses import Response
+
+from btvep.ttl_cache import TTLCache
+
+# Checks every window of a key and counts the request in all of them, or in
+# none. KEYS has one counter per window, ARGV the limit and the window length
+# in milliseconds of each counter. Returns 0 if the request is allowed,
+# otherwise the milliseconds until every full window has reset.
+MULTI_WINDOW_SCRIPT = """
+local wait = 0
+for i, key in ipairs(KEYS) do
+    local limit = tonumber(ARGV[i * 2 - 1])
+    local current = tonumber(redis.call("GET", key) or "0")
+    if current + 1 > limit then
+        local ttl = redis.call("PTTL", key)
+        if ttl < 0 then
+            ttl = tonumber(ARGV[i * 2])
+            if current > 0 then
+                redis.call("PEXPIRE", key, ttl)
+            end
+        end
+        wait = math.max(wait, ttl, 1)
+    end
+end
+if wait > 0 then
+    return wait
+end
+for i, key in ipairs(KEYS) do
+    if redis.call("INCR", key) == 1 then
+        redis.call("PEXPIRE", key, ARGV[i * 2])
+    end
+end
+return 0
+"""
+
+# Leases requests of several windows at once, all or nothing. KEYS has one
+# counter per window, ARGV the limit, the window length in milliseconds and the
+# number of requests to lease of each counter. Returns {0, granted, pttl, ...}
+# with the requests leased and the time left of each window, or {wait} with the
+# milliseconds until every full window has reset.
+LEASE_SCRIPT = """
+local wait = 0
+local left = {}
+for i, key in ipairs(KEYS) do
+    local limit = tonumber(ARGV[i * 3 - 2])
+    local current = tonumber(redis.call("GET", key) or "0")
+    left[i] = limit - current
+    if left[i] < 1 then
+        local ttl = redis.call("PTTL", key)
+        if ttl < 0 then
+            ttl = tonumber(ARGV[i * 3 - 1])
+            if current > 0 then
+                redis.call("PEXPIRE", key, ttl)
+            end
+        end
+        wait = math.max(wait, ttl, 1)
+    end
+end
+if wait > 0 then
+    return {wait}
+end
+local result = {0}
+for i, key in ipairs(KEYS) do
+    local granted = math.min(left[i], tonumber(ARGV[i * 3]))
+    if redis.call("INCRBY", key, granted) == granted then
+        redis.call("PEXPIRE", key, ARGV[i * 3 - 1])
+    end
+    table.insert(result, granted)
+    table.insert(result, redis.call("PTTL", key))
+end
+return result
+"""
+
+
+class RateLimiterCache:
+    """
+    Compiled rate limiters by API key id, so they are not rebuilt for every
+    request.
+
+    The rate limits of the key are the version of its limiter. A key edited with
+    btvep ratelimit or /admin/rate-limits gets a new limiter as soon as the API
+    key cache hands out the changed key.
+    """
+
+    def __init__(self, build: Callable[[Any], Any], max_entries: int = 10_000):
+        self.build = build
+        # key id -> (rate limits version, limiter)
+        self.entries = TTLCache(max_entries)
+
+    def get(self, api_key):
+        entry = self.entries.get(api_key.id)
+        if entry is not None and entry[0] == api_key.rate_limits:
+            return entry[1]
+        limiter = self.build(api_key)
+        self.entries.set(api_key.id, (api_key.rate_limits, limiter))
+        return limiter
+
+    def invalidate(self, key_id: int | None = None):
+        """Drop the limiter of the given key, or of every key if key_id is None."""
+        if key_id is None:
+            self.entries.clear()
+        else:
+            self.entries.pop(key_id)
+
+
+async def rate_limit_identifier(request: Request) -> str:
+    """Requests are rate limited by API key."""
+    return request.headers.get("Authorization").split(" ")[1]
+
+
+class RateLimiter:
+    """
+    Rate limits of one API key (or the global ones). Every request has to fit
+    in all windows, a rejected request is not counted in any of them.
+    """
+
+    uses_redis = False
+    prefix = "btvep-ratelimit"
+
+    def __init__(
+        self,
+        rate_limits: List[dict],
+        callback: Callable[[Request, Response, int], Awaitable],
+    ):
+        # (times, milliseconds) of each window
+        self.windows = [
+            (limit["times"], limit["seconds"] * 1000) for limit in rate_limits
+        ]
+        self.callback = callback
+
+    def keys(self, identifier: str) -> List[str]:
+        # The hash tag keeps all counters of a key on one Redis Cluster node
+        return [
+            f"{self.prefix}:{{{identifier}}}:{times}:{milliseconds}"
+            for times, milliseconds in self.windows
+        ]
+
+    async def check(self, identifier: str) -> int:
+        """Returns 0 if the request is allowed, otherwise the milliseconds to wait."""
+        raise NotImplementedError
+
+    async def __call__(self, request: Request, response: Response):
+        pexpire = await self.check(await rate_limit_identifier(request))
+        if pexpire != 0:
+            return await self.callback(request, response, pexpire)
+
+
+class RedisRateLimiter(RateLimiter):
+    """
+    Fixed windows counted in Redis and shared by all workers. All windows are
+    checked and counted atomically in a single round trip. Uses the Redis
+    connection set up by FastAPILimiter.init.
+    """
+
+    uses_redis = True
+
+    async def check(self, identifier: str) -> int:
+        args = [value for window in self.windows for value in window]
+        script = _get_script(FastAPILimiter.redis, MULTI_WINDOW_SCRIPT)
+        return int(await script(keys=self.keys(identifier), args=args))
+
+
+class RateLimitState(TTLCache):
+    """Per process rate limit state by key, the least recently used keys are dropped first."""
+
+    def __init__(self, max_entries: int = 100_000):
+        super().__init__(max_entries)
+
+
+class LocalRateLimiter(RateLimiter):
+    """
+    In process rate limiting with GCRA (a token bucket that stores a single
+    timestamp per key and window), for single worker deployments without Redis.
+    A window of times requests per seconds allows a burst of times requests,
+    and then one request every seconds / times.
+
+    State is kept by key and window in state, so a rebuilt limiter (e.g. after
+    a config reload) continues where the old one stopped.
+    """
+
+    prefix = "local"
+
+    def __init__(
+        self,
+        rate_limits: List[dict],
+        callback: Callable[[Request, Response, int], Awaitable],
+        state: RateLimitState,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        super().__init__(rate_limits, callback)
+        self.state = state
+        self.clock = clock
+
+    async def check(self, identifier: str) -> int:
+        now = self.clock() * 1000
+        keys = self.keys(identifier)
+        arrival_times = []
+        wait = 0
+        for key, (times, milliseconds) in zip(keys, self.windows):
+            if times <= 0:
+                wait = max(wait, milliseconds)
+                continue
+            # Theoretical arrival time: when the bucket of the window is full again
+            arrival_time = max(self.state.get(key, now), now) + milliseconds / times
+            wait = max(wait, arrival_time - milliseconds - now)
+            arrival_times.append(arrival_time)
+        if wait > 0:
+            return max(ceil(wait), 1)
+        for key, arrival_time in zip(keys, arrival_times):
+            self.state.set(key, arrival_time)
+        return 0
+
+
+class LeasedRateLimiter(RateLimiter):
+    """
+    Fixed windows counted in Redis, but each worker leases up to lease_size
+    requests of a window at once and spends them locally. Most requests don't
+    wait for Redis, while the limits still hold across workers. Leases end with
+    their window. Requests leased by one worker can't be used by another, so a
+    key can be rejected up to lease_size requests early per worker and window.
+    """
+
+    uses_redis = True
+    prefix = "btvep-ratelimit-lease"
+
+    def __init__(
+        self,
+        rate_limits: List[dict],
+        callback: Callable[[Request, Response, int], Awaitable],
+        state: RateLimitState,
+        lease_size: int = 10,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        super().__init__(rate_limits, callback)
+        self.state = state
+        self.lease_size = max(lease_size, 1)
+        self.clock = clock
+
+    async def check(self, identifier: str) -> int:
+        now = self.clock() * 1000
+        keys = self.keys(identifier)
+        # key -> [requests left, expires at]
+        leases = [self.state.get(key) for key in keys]
+        renew = [
+            i
+            for i, lease in enumerate(leases)
+            if lease is None or lease[0] < 1 or lease[1] <= now
+        ]
+        if renew:
+            # Keys over their limit aren't sent to Redis again until a window resets
+            blocked_key = f"{self.prefix}:{{{identifier}}}:blocked"
+            blocked_until = self.state.get(blocked_key, 0)
+            if blocked_until > now:
+                return max(ceil(blocked_until - now), 1)
+            args = []
+            for i in renew:
+                args += [*self.windows[i], self.lease_size]
+            script = _get_script(FastAPILimiter.redis, LEASE_SCRIPT)
+            result = await script(keys=[keys[i] for i in renew], args=args)
+            if int(result[0]) != 0:
+                self.state.set(blocked_key, now + int(result[0]))
+                return int(result[0])
+            for j, i in enumerate(renew):
+                granted, pttl = int(result[1 + 2 * j]), int(result[2 + 2 * j])
+                leases[i] = [granted, now + pttl]
+                self.state.set(keys[i], leases[i])
+        for lease in leases:
+            lease[0] -= 1
+        return 0
+
+
+# (redis client, registered script by source). Scripts are sent by hash and
+# only loaded into Redis again when it doesn't know them (e.g. after a restart).
+_scripts = (None, {})
+
+
+def _get_script(redis, script: str):
+    global _scripts
+    if _scripts[0] is not redis:
+        _scripts = (redis, {})
+    if script not in _scripts[1]:
+        _scripts[1][script] = redis.register_script(script)
+    return _scripts[1][script]
@@ -0,0 +1,99 @@
+import hashlib
+import json
+import logging
+from typing import List, Optional
+
+import redis
+import redis.asyncio
+
+from btvep.btvep_models import Message
+from btvep.config import Config
+from btvep.ttl_cache import TTLCache
+
+
+def make_cache_key(messages: List[Message], **query_strategy) -> str:
+    """Canonical hash of the roles, messages and query strategy of a request."""
+    canonical = json.dumps(
+        {
+            "messages": [[message.role, message.content] for message in messages],
+            "query_strategy": query_strategy,
+        },
+        sort_keys=True,
+        separators=(",", ":"),
+    )
+    return hashlib.sha256(canonical.encode()).hexdigest()
+
+
+class ResponseCache:
+    async def get(self, key: str) -> Optional[dict]:
+        raise NotImplementedError
+
+    async def set(self, key: str, response: dict):
+        raise NotImplementedError
+
+
+class MemoryResponseCache(ResponseCache):
+    """In-process cache with a TTL and LRU eviction on entry count and size in bytes."""
+
+    def __init__(self, ttl_seconds: int, max_entries: int, max_bytes: int):
+        self.max_bytes = max_bytes
+        # key -> serialized response
+        self.entries = TTLCache(max_entries, ttl_seconds, max_size=max_bytes)
+
+    async def get(self, key: str) -> Optional[dict]:
+        value = self.entries.get(key)
+        return json.loads(value) if value is not None else None
+
+    async def set(self, key: str, response: dict):
+        value = json.dumps(response)
+        if len(value) > self.max_bytes:
+            return
+        self.entries.set(key, value)
+
+
+class RedisResponseCache(ResponseCache):
+    """
+    Cache shared by all workers through Redis. Entries expire after the TTL,
+    size limits and LRU eviction are left to the Redis maxmemory settings.
+    """
+
+    prefix = "btvep:response-cache:"
+
+    def __init__(self, redis_url: str, ttl_seconds: int):
+        self.redis = redis.asyncio.from_url(
+            redis_url, encoding="utf-8", decode_responses=True
+        )
+        self.ttl_seconds = ttl_seconds
+
+    async def get(self, key: str) -> Optional[dict]:
+        # The cache is optional, requests go to the network while Redis is down
+        try:
+            value = await self.redis.get(self.prefix + key)
+        except redis.RedisError as e:
+            logging.warning(f"Could not read from the response cache: {e}")
+            return None
+        return json.loads(value) if value is not None else None
+
+    async def set(self, key: str, response: dict):
+        try:
+            await self.redis.set(
+                self.prefix + key, json.dumps(response), ex=self.ttl_seconds
+            )
+        except redis.RedisError as e:
+            logging.warning(f"Could not write to the response cache: {e}")
+
+
+config = Config().load()
+
+response_cache: ResponseCache | None = None
+if config.response_cache_enabled:
+    if config.response_cache_backend == "redis":
+        response_cache = RedisResponseCache(
+            config.redis_url, int(config.response_cache_ttl_seconds)
+        )
+    else:
+        response_cache = MemoryResponseCache(
+            int(config.response_cache_ttl_seconds),
+            int(config.response_cache_max_entries),
+            int(config.response_cache_max_bytes),
+        )
@@ -0,0 +1,99 @@
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Deque, Dict, Iterable, List, Optional
+
+
+@dataclass
+class UidStats:
+    """
+    Latency and success statistics for a single UID.
+    ewma_latency covers all responses, latencies only holds the most recent successful ones.
+    """
+
+    ewma_latency: Optional[float] = None
+    success_rate: Optional[float] = None
+    count: int = 0
+    latencies: Deque[float] = field(default_factory=deque)
+
+    def p90_latency(self) -> Optional[float]:
+        if not self.latencies:
+            return None
+        ordered = sorted(self.latencies)
+        return ordered[min(len(ordered) - 1, int(0.9 * len(ordered)))]
+
+
+class UidScoreboard:
+    """
+    In-memory scoreboard of observed miner latency and success per UID.
+
+    Every miner result is fed in with record(). UIDs that have never been seen
+    are scored with the prior values, so new miners still get explored.
+    """
+
+    def __init__(
+        self,
+        alpha: float = 0.2,
+        window: int = 50,
+        prior_latency: float = 12.0,
+        prior_success_rate: float = 0.5,
+    ):
+        self.alpha = alpha
+        self.window = window
+        self.prior_latency = prior_latency
+        self.prior_success_rate = prior_success_rate
+        self.stats: Dict[int, UidStats] = {}
+
+    def record(self, uid: int, elapsed: float, is_success: bool):
+        stats = self.stats.get(uid)
+        if stats is None:
+            stats = self.stats[uid] = UidStats(latencies=deque(maxlen=self.window))
+
+        success = 1.0 if is_success else 0.0
+        if stats.count == 0:
+            stats.ewma_latency = elapsed
+            stats.success_rate = success
+        else:
+            stats.ewma_latency += self.alpha * (elapsed - stats.ewma_latency)
+            stats.success_rate += self.alpha * (success - stats.success_rate)
+        if is_success:
+            stats.latencies.append(elapsed)
+        stats.count += 1
+
+    def score(self, uid: int) -> float:
+        """Expected successful responses per second. Higher is better."""
+        stats = self.stats.get(uid)
+        if stats is None or stats.count == 0:
+            return self.prior_success_rate / self.prior_latency
+        return stats.success_rate / max(stats.ewma_latency, 1e-3)
+
+    def p90_latency(self, uids: Iterable[int] | None = None) -> Optional[float]:
+        """p90 latency of successful responses over the given UIDs, or over all observed UIDs."""
+        uids = self.stats.keys() if uids is None else uids
+        latencies = sorted(
+            latency
+            for uid in uids
+            if uid in self.stats
+            for latency in self.stats[uid].latencies
+        )
+        if not latencies:
+            return None
+        return latencies[min(len(latencies) - 1, int(0.9 * len(latencies)))]
+
+    def rank(self, uids: Iterable[int]) -> List[int]:
+        """
+        Rank uids by score. The sort is stable, so ties (e.g. unobserved UIDs)
+        keep the order they were given in.
+        """
+        return sorted(uids, key=self.score, reverse=True)
+
+    def to_dict(self) -> Dict[int, dict]:
+        return {
+            uid: {
+                "ewma_latency": stats.ewma_latency,
+                "p90_latency": stats.p90_latency(),
+                "success_rate": stats.success_rate,
+                "count": stats.count,
+                "score": self.score(uid),
+            }
+            for uid, stats in self.stats.items()
+        }
@@ -1,3 +1,4 @@
+import asyncio
 import logging
 import rich
 import uvicorn
@@ -14,6 +15,7 @@ from btvep.api.dependencies import (
     InitializeRateLimiting,
 )
 from btvep.config import Config
+from btvep.db import api_keys
 from btvep.db.tables import create_all as create_all_tables
 from btvep.db.utils import DB_PATH
 from btvep.validator_prompter import ValidatorPrompter
@@ -59,9 +61,19 @@ async def unicorn_exception_handler(request: Request, exc: ChatResponseException
 
 @app.on_event("startup")
 async def startup():
-    if config.rate_limiting_enabled:
+    ValidatorPrompter().metagraph_syncer.start()
+    if api_keys.invalidation_channel is not None:
+        app.state.api_key_invalidation_listener = asyncio.create_task(
+            api_keys.invalidation_channel.listen(api_keys.api_key_cache.invalidate)
+        )
+    if config.rate_limiting_enabled and config.rate_limiting_backend != "local":
         await InitializeRateLimiting()
 
 
+@app.on_event("shutdown")
+async def shutdown():
+    await ValidatorPrompter().metagraph_syncer.stop()
+
+
 if __name__ == "__main__":
     uvicorn.run(app, host="0.0.0.0", port=8000)
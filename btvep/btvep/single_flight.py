@@ -0,0 +1,22 @@
+import asyncio
+from typing import Any, Awaitable, Callable, Dict
+
+
+class SingleFlight:
+    """
+    Coalesce concurrent calls with the same key into a single call.
+    The first caller starts the call, callers arriving while it is in flight
+    await the same result instead of starting their own.
+    """
+
+    def __init__(self):
+        self.in_flight: Dict[str, asyncio.Future] = {}
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Any:
+        future = self.in_flight.get(key)
+        if future is None:
+            future = asyncio.ensure_future(fn())
+            self.in_flight[key] = future
+            future.add_done_callback(lambda _: self.in_flight.pop(key, None))
+        # Shield so that a caller going away does not cancel the call for the others
+        return await asyncio.shield(future)
@@ -0,0 +1,86 @@
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Hashable, Iterator, Optional, Tuple
+
+
+class TTLCache:
+    """
+    In-process cache with an optional TTL and LRU eviction.
+
+    - Entries expire ttl_seconds after they were set, or at the expires_at
+      passed to set(). Without a TTL they only leave the cache when evicted.
+    - The least recently used entries are evicted once there are more than
+      max_entries of them, or once the summed size of the values is over
+      max_size (if given, size(value) is the size of a value).
+    - on_remove(key, value) is called for every entry that leaves the cache,
+      except on clear().
+    """
+
+    def __init__(
+        self,
+        max_entries: int,
+        ttl_seconds: Optional[float] = None,
+        clock: Callable[[], float] = time.monotonic,
+        max_size: Optional[int] = None,
+        size: Callable[[Any], int] = len,
+        on_remove: Optional[Callable[[Hashable, Any], None]] = None,
+    ):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.clock = clock
+        self.max_size = max_size
+        self.size = size
+        self.on_remove = on_remove
+        self.total_size = 0
+        # key -> (expires_at, value)
+        self.entries: OrderedDict[Hashable, Tuple[float, Any]] = OrderedDict()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __iter__(self) -> Iterator[Hashable]:
+        """Keys from the least to the most recently used, expired ones included."""
+        return iter(self.entries)
+
+    def get(self, key: Hashable, default=None):
+        entry = self.entries.get(key)
+        if entry is None:
+            return default
+        if entry[0] <= self.clock():
+            self.pop(key)
+            return default
+        self.entries.move_to_end(key)
+        return entry[1]
+
+    def set(self, key: Hashable, value, expires_at: Optional[float] = None):
+        if self.ttl_seconds is not None:
+            ttl_expires_at = self.clock() + self.ttl_seconds
+            expires_at = (
+                ttl_expires_at
+                if expires_at is None
+                else min(expires_at, ttl_expires_at)
+            )
+        if expires_at is None:
+            expires_at = float("inf")
+        self.pop(key)
+        self.entries[key] = (expires_at, value)
+        if self.max_size is not None:
+            self.total_size += self.size(value)
+        while len(self.entries) > self.max_entries or (
+            self.max_size is not None and self.total_size > self.max_size
+        ):
+            self.pop(next(iter(self.entries)))
+
+    def pop(self, key: Hashable, default=None):
+        entry = self.entries.pop(key, None)
+        if entry is None:
+            return default
+        if self.max_size is not None:
+            self.total_size -= self.size(entry[1])
+        if self.on_remove is not None:
+            self.on_remove(key, entry[1])
+        return entry[1]
+
+    def clear(self):
+        self.entries.clear()
+        self.total_size = 0
@@ -1,14 +1,20 @@
 import asyncio
 import logging
-from typing import List, Optional
+import time
+from collections import deque
+from itertools import islice
+from typing import AsyncGenerator, Dict, List, Optional, Tuple
 
 import bittensor as bt
 from bittensor import Keypair, metagraph, Keypair  # prompting,text_prompting
 
 from btvep.btvep_models import Message
-from btvep.constants import DEFAULT_NETUID
-from btvep.metagraph import MetagraphSyncer
-from btvep.prompting import Prompting
+from btvep.circuit_breaker import CircuitBreakerRegistry
+from btvep.config import Config
+from btvep.constants import DEFAULT_HEDGE_DELAY, DEFAULT_NETUID, DENDRITE_TIMEOUT
+from btvep.metagraph import MetagraphIndex, MetagraphSyncer
+from btvep.prompting import Prompting, PromptingResult
+from btvep.scoreboard import UidScoreboard
 
 # The MIT License (MIT)
 # Copyright © 2023 Yuma Rao
@@ -33,6 +39,46 @@ class MetagraphNotSyncedException(Exception):
     pass
 
 
+class NoAvailableUidsException(Exception):
+    """Raised when every requested uid is skipped because its circuit breaker is open."""
+
+    pass
+
+
+class QueryTaskGroup:
+    """
+    Keeps track of the miner queries started for a single API request, so that
+    queries that are still in flight when the request is done can be cancelled
+    and awaited instead of being left behind.
+    """
+
+    def __init__(self):
+        self.tasks: Dict[asyncio.Task, Tuple[int, float]] = {}
+
+    def create_task(self, uid: int, coro) -> asyncio.Task:
+        task = asyncio.create_task(coro)
+        self.tasks[task] = (uid, time.monotonic())
+        return task
+
+    async def aclose(self) -> List[dict]:
+        """
+        Cancel all queries still in flight and wait for them to finish.
+        Returns the cancelled uids with the seconds they were in flight.
+        """
+        in_flight = [task for task in self.tasks if not task.done()]
+        cancelled_at = time.monotonic()
+        for task in in_flight:
+            task.cancel()
+        await asyncio.gather(*in_flight, return_exceptions=True)
+
+        cancelled = [
+            {"uid": self.tasks[task][0], "elapsed": cancelled_at - self.tasks[task][1]}
+            for task in in_flight
+        ]
+        self.tasks.clear()
+        return cancelled
+
+
 class ValidatorPrompter:
     """
     ValidatorPrompter is a class that allows us to prompt the bittensor network
@@ -62,10 +108,23 @@ class ValidatorPrompter:
         return cls._instance
 
     def _initialize(self, hotkey_mnemonic: str):
-        self.metagraph_syncer = MetagraphSyncer(DEFAULT_NETUID)
-        self.metagraph_syncer.start_sync_thread()
+        config = Config().load()
+        self.metagraph_syncer = MetagraphSyncer(
+            DEFAULT_NETUID,
+            snapshot_max_staleness_seconds=int(
+                config.metagraph_snapshot_max_staleness_seconds
+            ),
+            shared=config.metagraph_sharing_enabled,
+        )
         self.hotkey = Keypair.create_from_mnemonic(hotkey_mnemonic)
         self.dendrite = bt.dendrite(wallet=self.hotkey)
+        # The dendrite appends every call to its history, keep only the most recent ones
+        self.dendrite.synapse_history = deque(maxlen=100)
+        self.scoreboard = UidScoreboard()
+        self.circuit_breakers = CircuitBreakerRegistry()
+        # Number of miner queries that were cancelled while still in flight
+        self.abandoned_queries = 0
+        self.recent_cancellations = deque(maxlen=100)
 
     def __init__(self, *args, **kwargs):
         pass
@@ -78,93 +137,260 @@ class ValidatorPrompter:
         in_parallel: Optional[int] = None,
         timeout: Optional[int] = None,
         respond_on_first_success: bool = True,
+        fastest_n: Optional[int] = None,
+        hedge: bool = False,
+        hedge_delay: Optional[float] = None,
     ):
+        return [
+            result
+            async for result in self.query_network_stream(
+                messages,
+                uids,
+                top_n,
+                in_parallel,
+                timeout,
+                respond_on_first_success,
+                fastest_n,
+                hedge,
+                hedge_delay,
+            )
+        ]
+
+    def query_network_stream(
+        self,
+        messages: List[Message],
+        uids: Optional[List[int]] = None,
+        top_n: Optional[int] = None,
+        in_parallel: Optional[int] = None,
+        timeout: Optional[int] = None,
+        respond_on_first_success: bool = True,
+        fastest_n: Optional[int] = None,
+        hedge: bool = False,
+        hedge_delay: Optional[float] = None,
+    ) -> AsyncGenerator[dict, None]:
+        """
+        Same as query_network, but returns an async iterator that yields each miner
+        result as soon as it lands. Validation happens eagerly, so errors such as
+        MetagraphNotSyncedException are raised before the iterator is consumed.
+
+        If hedge is set, uids are queried one at a time in order and a backup query
+        to the next uid is only started if no success has come in within hedge_delay
+        seconds (defaults to the observed p90 latency of uids). in_parallel and
+        respond_on_first_success are ignored in that case.
+        """
         if in_parallel is not None and in_parallel < 1:
             raise ValueError("in_parallel must be at least 1")
 
-        self._validate_metagraph()
+        # The syncer may swap in a new index at any time, a request sticks to one
+        index = self._get_index()
         roles, messages = self._prepare_messages(messages)
+        # Build, validate and hash the synapse once, each axon gets a cheap copy of it
+        synapse = Prompting(roles=roles, messages=messages)
+        synapse.body_hash
 
         if top_n is not None:
-            uids = self._get_top_uids(top_n)
+            uids = self._get_top_uids(index, top_n)
+        elif fastest_n is not None:
+            uids = self._get_fastest_uids(index, fastest_n)
         elif uids is None:
-            raise ValueError("Either uids or top_n must be specified")
+            raise ValueError("Either uids, top_n or fastest_n must be specified")
+        elif len(uids) > 0 and not any(self._is_available(index, uid) for uid in uids):
+            raise NoAvailableUidsException()
+
+        if hedge:
+            if hedge_delay is None:
+                # Only the latencies of the selected uids, sorting all of them
+                # would block the event loop on every request
+                hedge_delay = self.scoreboard.p90_latency(uids) or DEFAULT_HEDGE_DELAY
+            return self._process_hedged(index, uids, synapse, timeout, hedge_delay)
 
         in_parallel = in_parallel or len(
             uids
         )  # Default to processing all uids in parallel
-        return await self._process_in_parallel(
-            uids, roles, messages, in_parallel, timeout, respond_on_first_success
+        return self._process_in_parallel(
+            index, uids, synapse, in_parallel, timeout, respond_on_first_success
         )
 
-    def _validate_metagraph(self):
-        if self.metagraph_syncer.metagraph is None:
+    def _get_index(self) -> MetagraphIndex:
+        index = self.metagraph_syncer.index
+        if index is None:
             raise MetagraphNotSyncedException()
+        return index
 
     def _prepare_messages(self, messages: List[Message]):
         roles = [el.role for el in messages]
         messages = [el.content for el in messages]
         return roles, messages
 
-    def _get_top_uids(self, top_n: int):
-        _, indices = self.metagraph_syncer.metagraph.incentive.sort(descending=True)
-        return indices[:top_n].tolist()
+    def _is_available(self, index: MetagraphIndex, uid: int) -> bool:
+        hotkey = index.hotkeys[uid]
+        return self.circuit_breakers.is_available(uid, hotkey)
+
+    def _get_top_uids(self, index: MetagraphIndex, top_n: int):
+        # The index only holds serving axons, ranked by incentive.
+        # Uids with an open circuit breaker are replaced by the next best uid
+        available = (uid for uid in index.ranked_uids if self._is_available(index, uid))
+        return list(islice(available, top_n))
+
+    def _get_fastest_uids(self, index: MetagraphIndex, fastest_n: int):
+        # Rank all uids by observed latency and success rate.
+        # Ties, such as uids that were never queried, fall back to incentive order.
+        uids = [uid for uid in index.ranked_uids if self._is_available(index, uid)]
+        return self.scoreboard.rank(uids)[:fastest_n]
 
     async def _process_in_parallel(
-        self, uids, roles, messages, in_parallel, timeout, respond_on_first_success
+        self, index, uids, synapse, in_parallel, timeout, respond_on_first_success
     ):
-        results = []
+        # Sliding window: keep in_parallel queries in flight and start the next
+        # uid as soon as any of them finishes.
         uid_idx = 0
+        pending = set()
+        group = QueryTaskGroup()
 
-        while uid_idx < len(uids):
-            tasks = self._create_tasks(
-                uids, roles, messages, uid_idx, in_parallel, timeout
-            )
-            uid_idx += len(tasks)
-            if respond_on_first_success:
-                for future in asyncio.as_completed(tasks):
-                    result = await future
-                    results.append(result)
+        try:
+            while True:
+                tasks, uid_idx = self._create_tasks(
+                    index,
+                    group,
+                    uids,
+                    synapse,
+                    uid_idx,
+                    in_parallel - len(pending),
+                    timeout,
+                )
+                pending.update(tasks)
+                if not pending:
+                    return
+
+                done, pending = await asyncio.wait(
+                    pending, return_when=asyncio.FIRST_COMPLETED
+                )
+                for task in done:
+                    result = task.result()
+                    yield result
+                    if (
+                        respond_on_first_success
+                        and result["dendrite_response"].is_completion
+                    ):
+                        return  # Stop after the first successful result
+        finally:
+            # Cancel whatever is still running, e.g. after a first success
+            # or when the consumer stops iterating early.
+            await self._close_task_group(group)
+
+    async def _process_hedged(self, index, uids, synapse, timeout, hedge_delay):
+        loop = asyncio.get_running_loop()
+        # Backup queries are only started until the request timeout has passed
+        deadline = loop.time() + (timeout if timeout is not None else DENDRITE_TIMEOUT)
+        uid_idx = 0
+        pending = set()
+        group = QueryTaskGroup()
+
+        try:
+            while True:
+                wait_timeout = None
+                if uid_idx < len(uids) and loop.time() < deadline:
+                    # Start the next uid, either the first one, a backup after the
+                    # hedge delay passed or a replacement for a failed response
+                    # A backup only gets the time left, so the request as a
+                    # whole still ends within the timeout
+                    tasks, uid_idx = self._create_tasks(
+                        index,
+                        group,
+                        uids,
+                        synapse,
+                        uid_idx,
+                        1,
+                        max(deadline - loop.time(), 0),
+                    )
+                    pending.update(tasks)
+                    if uid_idx < len(uids):
+                        wait_timeout = max(0, min(hedge_delay, deadline - loop.time()))
+                if not pending:
+                    return  # Out of uids or past the deadline
+
+                done, pending = await asyncio.wait(
+                    pending, timeout=wait_timeout, return_when=asyncio.FIRST_COMPLETED
+                )
+                for task in done:
+                    result = task.result()
+                    yield result
                     if result["dendrite_response"].is_completion:
-                        for task in tasks:
-                            task.cancel()  # Cancel all other tasks
-                        return results  # Return the successful result
-            else:
-                results += await asyncio.gather(*tasks)
+                        return  # Stop after the first successful result
+        finally:
+            await self._close_task_group(group)
 
-        return results
+    async def _close_task_group(self, group: QueryTaskGroup):
+        cancelled = await group.aclose()
+        for cancellation in cancelled:
+            # A cancelled query gives no verdict on the miner
+            self.circuit_breakers.release(cancellation["uid"])
+        if cancelled:
+            self.abandoned_queries += len(cancelled)
+            self.recent_cancellations.extend(cancelled)
+            logging.info(
+                "Cancelled in-flight queries: "
+                + ", ".join(f"uid {c['uid']} ({c['elapsed']:.2f}s)" for c in cancelled)
+            )
 
-    def _create_tasks(self, uids, roles, messages, uid_idx, in_parallel, timeout):
+    def _create_tasks(self, index, group, uids, synapse, uid_idx, count, timeout):
+        """
+        Start up to count queries from uids[uid_idx:], skipping uids with an open
+        circuit breaker. Returns the tasks and the index of the next uid.
+        """
         tasks = []
-        for _ in range(min(in_parallel, len(uids) - uid_idx)):
+        while len(tasks) < count and uid_idx < len(uids):
             uid = uids[uid_idx]
             uid_idx += 1
-            task = asyncio.create_task(self._query_uid(roles, messages, uid, timeout))
+            hotkey = index.hotkeys[uid]
+            if not self.circuit_breakers.allow(uid, hotkey):
+                logging.info(f"Skipping uid {uid}, circuit breaker is open")
+                continue
+            task = group.create_task(uid, self._query_uid(index, synapse, uid, timeout))
             tasks.append(task)
-        return tasks
+        return tasks, uid_idx
 
-    async def _query_uid(self, roles, messages, uid, timeout=None):
+    async def _query_uid(self, index, synapse, uid, timeout=None):
         # Avoid overwriting the default timeout of bittensor if timeout is None
 
         logging.info(f"Querying uid {uid}")
         timeout_arg = {"timeout": timeout} if timeout is not None else {}
-        axon = self.metagraph_syncer.metagraph.axons[uid]
-        synapse = Prompting(roles=roles, messages=messages)
-        result = await self.dendrite.forward([axon], synapse, deserialize=False)
-        result = result[0]
+        axon = index.axon(uid)
+        # Same as dendrite.forward does for each axon, but without waiting for the
+        # other axons so results can be delivered as soon as they complete.
+        # dendrite.call swallows cancellation in its finally block, gather makes
+        # sure a cancelled query still raises CancelledError here.
+        (result,) = await asyncio.gather(
+            self.dendrite.call(
+                target_axon=axon,
+                synapse=synapse.copy(),
+                deserialize=False,
+                **timeout_arg,
+            )
+        )
         if result.dendrite.process_time:
-            result.elapsed = result.dendrite.process_time
-        else:
-            result.elapsed = result.timeout
-        result.dest_hotkey = axon.hotkey
-        result.return_code = result.dendrite.status_code
-        result.return_message = result.dendrite.status_message
-        if result.completion:
-            result.is_completion = True
+            elapsed = result.dendrite.process_time
         else:
+            elapsed = result.timeout
+        return_message = result.dendrite.status_message
+        if not result.completion and result.dendrite.status_code == 200:
             # Case empty dentrite response
-            if result.dendrite.status_code == 200:
-                result.return_message = "Empty response"
+            return_message = "Empty response"
+
+        result = PromptingResult(
+            completion=result.completion,
+            is_completion=bool(result.completion),
+            elapsed=elapsed,
+            dest_hotkey=axon.hotkey,
+            return_code=result.dendrite.status_code,
+            return_message=return_message,
+            src_version=result.src_version,
+            dest_version=result.dest_version,
+        )
+
+        self.scoreboard.record(uid, result.elapsed, result.is_completion)
+        # Only transport level failures such as timeouts count towards the breaker
+        self.circuit_breakers.record(uid, axon.hotkey, result.return_code == 200)
 
         response = {"uid": uid, "dendrite_response": result}
 
@@ -0,0 +1,62 @@
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from btvep.api import all_endpoints
+from btvep.db import api_keys
+from btvep.db.request import Request
+from btvep.db.tables import create_all
+from btvep.db.user import User, user_cache
+from btvep.db.utils import DB_PATH, db
+from btvep.validator_prompter import ValidatorPrompter
+
+from .fakes import FakeDendrite, fake_prompter
+
+
+@pytest.fixture
+def database(tmp_path):
+    """A fresh database for each test, btvep.db is left alone."""
+    if not db.is_closed():
+        db.close()
+    db.init(str(tmp_path / "btvep.db"), check_same_thread=False)
+    db.create_tables([User, Request])
+    create_all()
+    api_keys.api_key_cache.invalidate()
+    user_cache.invalidate()
+    yield db
+    if not db.is_closed():
+        db.close()
+    db.init(DB_PATH, check_same_thread=False)
+    api_keys.api_key_cache.invalidate()
+    user_cache.invalidate()
+
+
+@pytest.fixture
+def prompter(monkeypatch):
+    """
+    The ValidatorPrompter used by the endpoints, with a fake dendrite. Every
+    miner answers after 10ms unless prompter.dendrite.delays says otherwise.
+    """
+    dendrite = FakeDendrite({uid: 0.01 for uid in range(8)})
+    prompter = fake_prompter(dendrite)
+    monkeypatch.setattr(ValidatorPrompter, "_instance", prompter)
+    return prompter
+
+
+@pytest.fixture
+def api_key(database):
+    return api_keys.insert(api_key="test-key", credits=100)
+
+
+@pytest.fixture
+def app(database, prompter):
+    app = FastAPI()
+    app.include_router(all_endpoints)
+    return app
+
+
+@pytest.fixture
+def client(app):
+    client = TestClient(app)
+    client.headers["Authorization"] = "Bearer test-key"
+    return client
@@ -0,0 +1,77 @@
+"""Fakes of the bittensor network shared by the tests."""
+
+import asyncio
+from collections import deque
+from types import SimpleNamespace
+
+from btvep.circuit_breaker import CircuitBreakerRegistry
+from btvep.metagraph import CompactMetagraph, MetagraphIndex
+from btvep.scoreboard import UidScoreboard
+from btvep.validator_prompter import ValidatorPrompter
+
+
+class FakeDendrite:
+    """
+    Answers like dendrite.call after the delay of the uid, with an empty
+    completion for uids that fail. Queries that take longer than their timeout
+    fail with a 408. Keeps track of when each query started and which ones were
+    cancelled.
+    """
+
+    def __init__(self, delays, failing=()):
+        self.delays = delays
+        self.failing = failing
+        self.started = []
+        self.cancelled = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.started_at = None
+
+    def elapsed(self):
+        return asyncio.get_running_loop().time() - self.started_at
+
+    async def call(self, target_axon, synapse, deserialize=False, timeout=12):
+        if self.started_at is None:
+            self.started_at = asyncio.get_running_loop().time()
+        uid = int(target_axon.hotkey.split("-")[1])
+        self.started.append((uid, self.elapsed()))
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        delay = self.delays[uid]
+        try:
+            await asyncio.sleep(min(delay, timeout))
+        except asyncio.CancelledError:
+            self.cancelled.append(uid)
+            raise
+        finally:
+            self.in_flight -= 1
+        if delay > timeout:
+            synapse.dendrite.status_code = 408
+            synapse.dendrite.process_time = timeout
+        else:
+            synapse.dendrite.status_code = 200
+            synapse.dendrite.process_time = delay
+            if uid not in self.failing:
+                synapse.completion = f"completion of {uid}"
+        return synapse
+
+
+def fake_prompter(dendrite, n=8):
+    metagraph = CompactMetagraph(
+        1,
+        hotkeys=[f"hotkey-{uid}" for uid in range(n)],
+        ips=["1.2.3.4"] * n,
+        ports=[8091 + uid for uid in range(n)],
+        ip_types=[4] * n,
+        incentive=[1.0 - uid / n for uid in range(n)],
+        block=100,
+        timestamp=0,
+    )
+    prompter = object.__new__(ValidatorPrompter)
+    prompter.metagraph_syncer = SimpleNamespace(index=MetagraphIndex(metagraph))
+    prompter.dendrite = dendrite
+    prompter.scoreboard = UidScoreboard()
+    prompter.circuit_breakers = CircuitBreakerRegistry()
+    prompter.abandoned_queries = 0
+    prompter.recent_cancellations = deque(maxlen=100)
+    return prompter
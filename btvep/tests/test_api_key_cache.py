@@ -0,0 +1,82 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+import redis
+
+from btvep.api_key_cache import ApiKeyCache, RedisInvalidationChannel
+
+
+def make_cache(keys, **kwargs):
+    loads = []
+
+    def load(token):
+        loads.append(token)
+        return keys.get(token)
+
+    options = dict(ttl_seconds=60, max_entries=10, max_negative_entries=2)
+    return ApiKeyCache(load, **{**options, **kwargs}), loads
+
+
+def test_cache_hits_invalidation_and_usage():
+    key = SimpleNamespace(id=1, credits=10, api_request_count=0, request_count=0)
+    cache, loads = make_cache({"token": key})
+    assert cache.get("token") is key
+    assert cache.get("token") is key
+    assert loads == ["token"]
+
+    cache.apply_usage(1, api_request_count=1, request_count=3, credits_used=3)
+    assert (key.credits, key.api_request_count, key.request_count) == (7, 1, 3)
+
+    # Invalidating by id or token reloads the key
+    cache.invalidate(1)
+    cache.get("token")
+    cache.invalidate("token")
+    cache.get("token")
+    assert loads == ["token"] * 3
+
+
+def test_negative_entries_are_capped():
+    cache, loads = make_cache({})
+    for token in ["a", "b", "c"]:
+        assert cache.get(token) is None
+    assert list(cache.negative_entries) == ["b", "c"]
+    cache.get("c")
+    assert loads == ["a", "b", "c"]
+
+
+def test_entries_expire():
+    cache, loads = make_cache({"token": SimpleNamespace(id=1)}, ttl_seconds=0)
+    cache.get("token")
+    cache.get("token")
+    assert len(loads) == 2
+
+
+def test_invalidation_channel_closes_connections_before_reconnecting(monkeypatch):
+    closed = []
+
+    class FakePubSub:
+        async def subscribe(self, channel):
+            raise redis.ConnectionError("Connection refused")
+
+        async def aclose(self):
+            closed.append("pubsub")
+
+    class FakeClient:
+        def pubsub(self):
+            return FakePubSub()
+
+        async def aclose(self):
+            closed.append("client")
+
+    async def sleep(seconds):
+        # Stop instead of reconnecting
+        raise asyncio.CancelledError()
+
+    monkeypatch.setattr("redis.asyncio.from_url", lambda url: FakeClient())
+    monkeypatch.setattr("btvep.api_key_cache.asyncio.sleep", sleep)
+    channel = RedisInvalidationChannel("redis://localhost")
+
+    with pytest.raises(asyncio.CancelledError):
+        asyncio.run(channel.listen(lambda query: None))
+    assert closed == ["pubsub", "client"]
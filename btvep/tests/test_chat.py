@@ -0,0 +1,163 @@
+import asyncio
+import json
+
+from btvep.constants import COST
+from btvep.db import api_keys
+from btvep.db.request import Request
+from btvep.response_cache import MemoryResponseCache
+
+
+def parse_sse(text):
+    """(event, data) of each Server-Sent Event in text."""
+    events = []
+    for message in text.strip().split("\n\n"):
+        event, data = message.split("\n")
+        events.append((event[len("event: ") :], json.loads(data[len("data: ") :])))
+    return events
+
+
+def stream_chat(client, **body):
+    response = client.post(
+        "/chat",
+        json={"messages": [{"role": "user", "content": "hi"}], "stream": True, **body},
+    )
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/event-stream")
+    return parse_sse(response.text)
+
+
+def summary(events):
+    return [(event, data.get("uid")) for event, data in events]
+
+
+def test_stream_emits_responses_as_they_land(client, api_key, prompter):
+    prompter.dendrite.delays = {0: 0.1, 1: 0.01, 2: 0.05}
+    prompter.dendrite.failing = [1]
+
+    events = stream_chat(client, uids=[0, 1, 2], respond_on_first_success=False)
+
+    assert summary(events) == [
+        ("failed_response", 1),
+        ("choice", 2),
+        ("choice", 0),
+        ("done", None),
+    ]
+    assert [data["first_success"] for event, data in events if event == "choice"] == [
+        True,
+        False,
+    ]
+    assert events[-1][1] == {"choices": 2, "failed_responses": 1}
+    key = api_keys.get("test-key")
+    assert key.api_request_count == 1
+    assert key.request_count == 3
+    assert key.credits == 100 - 2 * COST
+    assert Request.select().count() == 3
+
+
+def test_stream_ends_on_first_success(client, api_key, prompter):
+    prompter.dendrite.delays = {0: 1, 1: 0.01}
+
+    events = stream_chat(client, uids=[0, 1])
+
+    assert summary(events) == [("choice", 1), ("done", None)]
+    assert prompter.dendrite.cancelled == [0]
+
+
+def test_stream_reports_when_all_responses_failed(client, api_key, prompter):
+    prompter.dendrite.failing = [0, 1]
+
+    events = stream_chat(client, uids=[0, 1])
+
+    assert [event for event, _ in events] == [
+        "failed_response",
+        "failed_response",
+        "error",
+        "done",
+    ]
+    assert events[2][1]["detail"] == "All miner responses have failed."
+    assert len(events[2][1]["failed_responses"]) == 2
+    assert events[3][1] == {"choices": 0, "failed_responses": 2}
+    # Nothing to pay for, but the request is counted
+    key = api_keys.get("test-key")
+    assert key.api_request_count == 1
+    assert key.credits == 100
+
+
+def test_cached_stream_replays_the_same_events(client, api_key, prompter, monkeypatch):
+    cache = MemoryResponseCache(ttl_seconds=60, max_entries=100, max_bytes=100_000)
+    monkeypatch.setattr("btvep.api.chat.response_cache", cache)
+    prompter.dendrite.delays = {0: 0.1, 1: 0.01, 2: 0.05}
+    prompter.dendrite.failing = [1]
+
+    live = stream_chat(client, uids=[0, 1, 2], respond_on_first_success=False)
+    cached = stream_chat(client, uids=[0, 1, 2], respond_on_first_success=False)
+
+    assert len(prompter.dendrite.started) == 3
+    assert summary(cached) == summary(live)
+    assert all(data["cached"] for _, data in cached)
+    assert [{**data, "cached": True} for _, data in live] == [
+        data for _, data in cached
+    ]
+
+
+def test_stream_is_charged_and_logged_when_the_client_disconnects(
+    app, api_key, prompter
+):
+    prompter.dendrite.delays = {0: 0.01, 1: 1}
+    body = json.dumps(
+        {
+            "messages": [{"role": "user", "content": "hi"}],
+            "uids": [0, 1],
+            "respond_on_first_success": False,
+            "stream": True,
+        }
+    ).encode()
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": "POST",
+        "scheme": "http",
+        "path": "/chat",
+        "raw_path": b"/chat",
+        "root_path": "",
+        "query_string": b"",
+        "headers": [
+            (b"authorization", b"Bearer test-key"),
+            (b"content-type", b"application/json"),
+            (b"content-length", str(len(body)).encode()),
+        ],
+        "client": ("127.0.0.1", 1234),
+        "server": ("testserver", 80),
+    }
+
+    async def run():
+        first_event = asyncio.Event()
+        sent = []
+        requests = [{"type": "http.request", "body": body, "more_body": False}]
+
+        async def receive():
+            if requests:
+                return requests.pop(0)
+            # The client goes away after the first event
+            await first_event.wait()
+            return {"type": "http.disconnect"}
+
+        async def send(message):
+            if message["type"] == "http.response.body" and message.get("body"):
+                sent.append(message["body"].decode())
+                first_event.set()
+
+        await asyncio.wait_for(app(scope, receive, send), timeout=5)
+        return sent
+
+    sent = asyncio.run(run())
+
+    assert summary(parse_sse("".join(sent))) == [("choice", 0)]
+    # The query to uid 1 was cancelled, the answer of uid 0 is paid for
+    assert prompter.dendrite.cancelled == [1]
+    key = api_keys.get("test-key")
+    assert key.api_request_count == 1
+    assert key.request_count == 1
+    assert key.credits == 100 - COST
+    assert Request.select().count() == 1
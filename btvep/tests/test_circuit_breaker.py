@@ -0,0 +1,38 @@
+import time
+
+from btvep.circuit_breaker import BreakerState, CircuitBreakerRegistry
+
+
+def test_breaker_opens_and_probes_once():
+    breakers = CircuitBreakerRegistry(failure_threshold=2, open_seconds=0.05)
+    for _ in range(2):
+        assert breakers.allow(1, "hotkey")
+        breakers.record(1, "hotkey", is_success=False)
+    assert breakers.breakers[1].state == BreakerState.OPEN
+    assert not breakers.allow(1, "hotkey")
+
+    time.sleep(0.05)
+    # Only a single probe is let through once the open period has passed
+    assert breakers.is_available(1, "hotkey")
+    assert breakers.allow(1, "hotkey")
+    assert not breakers.allow(1, "hotkey")
+    breakers.record(1, "hotkey", is_success=True)
+    assert breakers.breakers[1].state == BreakerState.CLOSED
+
+
+def test_new_hotkey_resets_breaker():
+    breakers = CircuitBreakerRegistry(failure_threshold=1)
+    breakers.record(1, "old_hotkey", is_success=False)
+    assert not breakers.allow(1, "old_hotkey")
+    assert breakers.allow(1, "new_hotkey")
+
+
+def test_checking_availability_does_not_create_breakers():
+    breakers = CircuitBreakerRegistry(failure_threshold=1)
+    assert all(breakers.is_available(uid, f"hotkey{uid}") for uid in range(100))
+    assert breakers.breakers == {}
+
+    breakers.record(1, "old_hotkey", is_success=False)
+    assert not breakers.is_available(1, "old_hotkey")
+    assert breakers.is_available(1, "new_hotkey")
+    assert breakers.breakers[1].hotkey == "old_hotkey"
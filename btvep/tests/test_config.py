@@ -0,0 +1,27 @@
+import os
+
+from btvep.config import Config, ConfigSnapshot
+
+
+def test_snapshot_reloads_when_the_file_changes(tmp_path, monkeypatch):
+    path = tmp_path / "config.json"
+    monkeypatch.setattr("btvep.config.CONFIG_PATH", str(path))
+    monkeypatch.delenv("RATE_LIMITING_ENABLED", raising=False)
+    snapshot = ConfigSnapshot(str(path), check_interval=0)
+    reloads = []
+    snapshot.subscribe(lambda new, old: reloads.append((new, old)))
+
+    config = snapshot.get()
+    assert snapshot.get() is config
+    assert reloads == []
+
+    changed = Config().load()
+    changed.rate_limiting_enabled = True
+    changed.save()
+    assert snapshot.get().rate_limiting_enabled
+    assert reloads == [(snapshot.get(), config)]
+
+    # A broken file keeps the last good config
+    path.write_text("{")
+    os.utime(path, ns=(0, 0))
+    assert snapshot.get().rate_limiting_enabled
@@ -0,0 +1,188 @@
+import asyncio
+import concurrent.futures
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from btvep.filter import Filter, LocalFilter, ModerationBatcher, OpenAIFilter
+
+
+class FakeFilter(Filter):
+    def __init__(self, flagged_words=(), delay=0, **kwargs):
+        super().__init__(**kwargs)
+        self.flagged_words = flagged_words
+        self.delay = delay
+        self.calls = []
+
+    def check(self, input):
+        self.calls.append(input)
+        time.sleep(self.delay)
+        flagged = [content in self.flagged_words for content in input]
+        return {"response": None, "flagged": flagged, "any_flagged": any(flagged)}
+
+
+def test_verdicts_are_cached_by_content():
+    filter = FakeFilter(flagged_words=["bad"])
+
+    async def run():
+        assert not (await filter.safe_check(["system", "hi", "hi"]))["any_flagged"]
+        assert not (await filter.safe_check(["system", "hello"]))["any_flagged"]
+        assert (await filter.safe_check(["system", "bad"]))["any_flagged"]
+        assert (await filter.safe_check(["bad"]))["any_flagged"]
+
+    asyncio.run(run())
+    assert filter.calls == [["system", "hi"], ["hello"], ["bad"]]
+
+
+def test_timeout_allows_without_blocking_the_event_loop():
+    filter = FakeFilter(delay=0.5, timeout_seconds=0.05, max_concurrency=1)
+
+    async def run():
+        ticks = 0
+
+        async def tick():
+            nonlocal ticks
+            while True:
+                await asyncio.sleep(0.01)
+                ticks += 1
+
+        ticker = asyncio.create_task(tick())
+        started = time.monotonic()
+        result = await filter.safe_check(["slow"])
+        elapsed = time.monotonic() - started
+        ticker.cancel()
+        return result, elapsed, ticks
+
+    result, elapsed, ticks = asyncio.run(run())
+    assert not result["any_flagged"]
+    assert elapsed < 0.3
+    assert ticks > 0
+    filter.close()
+
+
+def test_closed_filter_finishes_the_calls_in_flight():
+    filter = FakeFilter(
+        flagged_words=["bad"], delay=0.1, max_concurrency=1, max_batch_size=1
+    )
+
+    async def run():
+        started = time.monotonic()
+        checks = [
+            asyncio.create_task(filter.safe_check([content]))
+            for content in ["bad", "good", "bad again"]
+        ]
+        # Closed while the first call runs and the others are queued,
+        # e.g. when the filter is replaced after a config reload
+        await asyncio.sleep(0.05)
+        filter.close()
+        results = await asyncio.gather(*checks)
+        return results, time.monotonic() - started
+
+    results, elapsed = asyncio.run(run())
+    assert [result["any_flagged"] for result in results] == [True, False, False]
+    assert elapsed < 1
+
+
+def test_cancelled_moderation_call_fails_its_callers():
+    executor = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+    batcher = ModerationBatcher(
+        lambda input: time.sleep(0.1), executor, max_batch_size=1
+    )
+
+    async def run():
+        first = asyncio.create_task(batcher.check(["first"]))
+        second = asyncio.create_task(batcher.check(["second"]))
+        await asyncio.sleep(0.05)
+        # The queued call of the second batch is cancelled
+        executor.shutdown(wait=False, cancel_futures=True)
+        started = time.monotonic()
+        try:
+            await asyncio.wait_for(second, timeout=1)
+        except RuntimeError:
+            pass
+        else:
+            assert False, "the cancelled call did not fail"
+        elapsed = time.monotonic() - started
+        first.cancel()
+        await asyncio.gather(first, return_exceptions=True)
+        return elapsed
+
+    assert asyncio.run(run()) < 0.5
+
+
+class FakeModerationServer(ThreadingHTTPServer):
+    """Answers like the moderation endpoint, flags inputs that contain "bad"."""
+
+    def __init__(self):
+        self.inputs = []
+
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+                server.inputs.append(body["input"])
+                results = [{"flagged": "bad" in input} for input in body["input"]]
+                response = json.dumps({"id": "modr-1", "results": results}).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(response)))
+                self.end_headers()
+                self.wfile.write(response)
+
+            def log_message(self, *args):
+                pass
+
+        super().__init__(("127.0.0.1", 0), Handler)
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}/v1"
+
+
+def test_concurrent_requests_share_moderation_calls():
+    server = FakeModerationServer()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    filter = OpenAIFilter(
+        "test-key",
+        api_base=server.url,
+        max_batch_size=8,
+        max_batch_wait_seconds=0.05,
+    )
+
+    async def run():
+        requests = [["system", f"message {i}"] for i in range(20)]
+        requests[3] = ["system", "something bad"]
+        return await asyncio.gather(*[filter.safe_check(r) for r in requests])
+
+    try:
+        results = asyncio.run(run())
+    finally:
+        server.shutdown()
+        filter.close()
+
+    assert [result["any_flagged"] for result in results] == [i == 3 for i in range(20)]
+    # 5 calls instead of 20, the shared system message is sent once per call
+    assert len(server.inputs) == 5
+    assert all(len(inputs) <= 8 for inputs in server.inputs)
+    assert all(inputs.count("system") == 1 for inputs in server.inputs)
+
+
+def test_local_filter_blocks_keywords_and_skips_allowed_contents():
+    local_filter = LocalFilter(
+        blocklist=["bad", "very bad phrase", " "],
+        allowlist=["You are a helpful assistant."],
+    )
+
+    result = local_filter.check(["You are a helpful assistant.", "Hello", None])
+    assert not result["any_flagged"]
+    assert result["unchecked"] == ["Hello", None]
+
+    # Whole words only, case-insensitive, the longest entry wins
+    assert not local_filter.check(["badge"])["any_flagged"]
+    assert local_filter.check(["That was BAD."])["matches"] == ["BAD"]
+    assert local_filter.check(["a very bad phrase"])["matches"] == ["very bad phrase"]
+    assert local_filter.check(["hi", "bad"])["unchecked"] == ["hi"]
+
+    assert LocalFilter().check(["bad"])["unchecked"] == ["bad"]
@@ -0,0 +1,118 @@
+import asyncio
+import json
+import time
+
+import jwt
+import pytest
+from cryptography.hazmat.primitives.asymmetric import rsa
+
+from btvep.api import dependencies
+from btvep.config import Config
+from btvep.jwt_auth import JwksCache, TokenVerifier
+
+
+def make_key(kid):
+    private_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    jwk = json.loads(jwt.algorithms.RSAAlgorithm.to_jwk(private_key.public_key()))
+    return private_key, {**jwk, "kid": kid, "alg": "RS256", "use": "sig"}
+
+
+def sign(private_key, kid, **claims):
+    claims = {"sub": "user", "aud": "api", "iss": "issuer", **claims}
+    return jwt.encode(claims, private_key, algorithm="RS256", headers={"kid": kid})
+
+
+class LocalJwks:
+    """Stand-in for the JWKS endpoint of the auth provider."""
+
+    def __init__(self, *jwks):
+        self.keys = list(jwks)
+        self.fetches = 0
+
+    def __call__(self, url):
+        self.fetches += 1
+        return {"keys": self.keys}
+
+
+def test_verify_caches_keys_and_claims():
+    private_key, jwk = make_key("one")
+    jwks = LocalJwks(jwk)
+    verifier = TokenVerifier(JwksCache("jwks", fetch_jwks=jwks), "api", "issuer")
+
+    async def run():
+        token = sign(private_key, "one", exp=int(time.time()) + 60)
+        assert (await verifier.verify(token))["sub"] == "user"
+        assert (await verifier.verify(token))["sub"] == "user"
+        await verifier.verify(sign(private_key, "one", sub="other"))
+        assert jwks.fetches == 1
+
+        # Invalid tokens are never cached
+        with pytest.raises(jwt.exceptions.InvalidAudienceError):
+            await verifier.verify(sign(private_key, "one", aud="other"))
+
+    asyncio.run(run())
+
+
+def test_unknown_kid_refetches_at_most_once_per_interval():
+    old_private_key, old_jwk = make_key("old")
+    new_private_key, new_jwk = make_key("new")
+    jwks = LocalJwks(old_jwk)
+    cache = JwksCache("jwks", min_refetch_seconds=0.05, fetch_jwks=jwks)
+    verifier = TokenVerifier(cache, "api", "issuer")
+
+    async def run():
+        await verifier.verify(sign(old_private_key, "old"))
+        # The provider rotates its keys
+        jwks.keys.append(new_jwk)
+        await asyncio.sleep(0.05)
+        await verifier.verify(sign(new_private_key, "new"))
+        assert jwks.fetches == 2
+
+        for _ in range(3):
+            with pytest.raises(jwt.exceptions.PyJWKClientError):
+                await verifier.verify(sign(new_private_key, "made-up"))
+        assert jwks.fetches == 2
+
+    asyncio.run(run())
+
+
+def test_expired_claims_are_not_served_from_cache():
+    private_key, jwk = make_key("one")
+    verifier = TokenVerifier(
+        JwksCache("jwks", fetch_jwks=LocalJwks(jwk)), "api", "issuer"
+    )
+    token = sign(private_key, "one", exp=int(time.time()) + 1)
+
+    async def run():
+        await verifier.verify(token)
+        assert verifier.verified_tokens.get(token) is not None
+        await asyncio.sleep(1.1)
+        assert verifier.verified_tokens.get(token) is None
+        with pytest.raises(jwt.exceptions.ExpiredSignatureError):
+            await verifier.verify(token)
+
+    asyncio.run(run())
+
+
+def test_replaced_verifier_stops_refreshing(monkeypatch):
+    # Restored after the test, on_config_reload replaces them
+    for name in ["config", "token_verifier", "global_rate_limiter"]:
+        monkeypatch.setattr(dependencies, name, getattr(dependencies, name))
+    private_key, jwk = make_key("one")
+    verifier = TokenVerifier(
+        JwksCache("jwks", fetch_jwks=LocalJwks(jwk)), "api", "issuer"
+    )
+    monkeypatch.setattr(dependencies, "token_verifier", verifier)
+    old_config = Config(auth0_domain="old.example.com")
+    new_config = Config(auth0_domain="new.example.com")
+
+    async def run():
+        await verifier.verify(sign(private_key, "one"))
+        refresh_task = verifier.jwks.refresh_task
+        assert not refresh_task.done()
+        dependencies.on_config_reload(new_config, old_config)
+        await asyncio.sleep(0)
+        assert refresh_task.cancelled()
+        assert dependencies.token_verifier is not verifier
+
+    asyncio.run(run())
@@ -0,0 +1,149 @@
+import asyncio
+from types import SimpleNamespace
+
+import bittensor
+import torch
+
+from btvep.metagraph import CompactMetagraph, MetagraphIndex, MetagraphSyncer
+
+
+def fake_metagraph(ips=None, ports=None):
+    n = 4
+    ips = ips or ["1.2.3.4"] * n
+    ports = ports or [8091 + uid for uid in range(n)]
+    axons = [
+        bittensor.AxonInfo(
+            version=1,
+            ip=ips[uid],
+            port=ports[uid],
+            ip_type=4,
+            hotkey=f"hotkey-{uid}",
+            coldkey="coldkey",
+        )
+        for uid in range(n)
+    ]
+    return SimpleNamespace(
+        axons=axons,
+        uids=torch.arange(n),
+        incentive=torch.tensor([0.1, 0.4, 0.2, 0.3]),
+        block=torch.tensor(100),
+    )
+
+
+def test_snapshot_round_trip(tmp_path):
+    CompactMetagraph.from_metagraph(1, fake_metagraph()).save(tmp_path)
+
+    syncer = MetagraphSyncer(1, snapshot_dir=tmp_path)
+    snapshot = syncer.load_snapshot()
+    assert syncer.metagraph is snapshot
+    assert syncer.index.ranked_uids == (1, 3, 2, 0)
+    assert snapshot.block == 100
+    axon = snapshot.axon(2)
+    assert (axon.hotkey, axon.ip, axon.port) == ("hotkey-2", "1.2.3.4", 8093)
+
+    # Snapshots of other subnets and stale snapshots are ignored
+    assert MetagraphSyncer(2, snapshot_dir=tmp_path).load_snapshot() is None
+    stale = MetagraphSyncer(1, snapshot_dir=tmp_path, snapshot_max_staleness_seconds=-1)
+    assert stale.load_snapshot() is None
+    assert stale.metagraph is None
+
+
+def test_index_skips_axons_that_are_not_serving():
+    metagraph = fake_metagraph(
+        ips=["1.2.3.4", "0.0.0.0", "1.2.3.4", "1.2.3.4"], ports=[8091, 8092, 8093, 0]
+    )
+    index = MetagraphIndex(CompactMetagraph.from_metagraph(1, metagraph))
+    assert index.ranked_uids == (2, 0)
+    assert index.serving.tolist() == [True, False, True, False]
+    assert index.hotkey_to_uid["hotkey-3"] == 3
+
+
+class FakeSubtensor:
+    """Fails the first failures syncs, then returns fake_metagraph()."""
+
+    def __init__(self, failures=0):
+        self.failures = failures
+        self.calls = 0
+
+    def metagraph(self, netuid):
+        self.calls += 1
+        if self.calls <= self.failures:
+            raise ConnectionError("chain endpoint unavailable")
+        return fake_metagraph()
+
+
+def test_sync_backs_off_and_reports_health(tmp_path):
+    subtensor = FakeSubtensor(failures=2)
+    connections = []
+    syncer = MetagraphSyncer(
+        1,
+        snapshot_dir=tmp_path,
+        backoff_base_seconds=1,
+        subtensor_factory=lambda: connections.append(subtensor) or subtensor,
+    )
+
+    async def sync_until_success():
+        delays = []
+        while True:
+            try:
+                await syncer.sync()
+                return delays
+            except ConnectionError:
+                delays.append(syncer.next_delay())
+                assert syncer.health()["consecutive_failures"] == len(delays)
+
+    delays = asyncio.run(sync_until_success())
+    assert 0.5 <= delays[0] <= 1 and 1 <= delays[1] <= 2
+    # The connection is dropped after every failure and kept after a success
+    assert len(connections) == 3
+    asyncio.run(syncer.sync())
+    assert len(connections) == 3
+
+    health = syncer.health()
+    assert health["synced"] and health["block"] == 100
+    assert health["consecutive_failures"] == 0
+    assert health["last_sync_error"] is None
+    assert syncer.next_delay() == syncer.rest_seconds
+
+
+def test_shared_metagraph_is_published_to_followers(tmp_path):
+    leader = MetagraphSyncer(
+        1, snapshot_dir=tmp_path, shared=True, subtensor_factory=FakeSubtensor
+    )
+    follower = MetagraphSyncer(1, snapshot_dir=tmp_path, shared=True)
+    assert leader.is_leader()
+    assert not follower.is_leader()
+    assert follower.follow() is None
+
+    asyncio.run(leader.sync())
+    assert leader.generation.get() == 1
+    assert follower.follow() is not None
+    assert follower.index.ranked_uids == (1, 3, 2, 0)
+    # Nothing new to load until the leader publishes the next generation
+    assert follower.follow() is None
+
+
+def test_followers_ignore_a_stale_generation_after_a_restart(tmp_path):
+    leader = MetagraphSyncer(
+        1, snapshot_dir=tmp_path, shared=True, subtensor_factory=FakeSubtensor
+    )
+    asyncio.run(leader.sync())
+    # The snapshot of the last run is old, but the counter on disk is still 1
+    stale = CompactMetagraph.load(tmp_path, 1)
+    stale.timestamp -= 7200
+    stale.save(tmp_path)
+    del leader
+
+    follower = MetagraphSyncer(
+        1, snapshot_dir=tmp_path, shared=True, snapshot_max_staleness_seconds=3600
+    )
+    assert follower.generation.get() == 1
+    assert follower.follow() is None
+    assert follower.index is None
+    assert not follower.health()["synced"]
+
+    # The next generation published by the new leader is used
+    CompactMetagraph.from_metagraph(1, fake_metagraph()).save(tmp_path)
+    follower.generation.increment()
+    assert follower.follow() is not None
+    assert follower.index.ranked_uids == (1, 3, 2, 0)
@@ -0,0 +1,66 @@
+import uuid
+from types import SimpleNamespace
+
+import bittensor as bt
+import pytest
+
+from btvep.prompting import Prompting
+
+
+@pytest.fixture
+def hashes(monkeypatch):
+    """Counts the fields and bodies hashed by bittensor."""
+    hashes = []
+    original = bt.utils.hash
+
+    def counting_hash(content):
+        hashes.append(content)
+        return original(content)
+
+    monkeypatch.setattr("bittensor.utils.hash", counting_hash)
+    return hashes
+
+
+def sign(synapse):
+    """Sign the synapse for an axon the way dendrite.call does."""
+    dendrite = SimpleNamespace(
+        external_ip="127.0.0.1",
+        uuid=uuid.uuid1(),
+        keypair=bt.Keypair.create_from_uri("//Alice"),
+    )
+    axon = bt.AxonInfo(
+        version=1,
+        ip="1.2.3.4",
+        port=8091,
+        ip_type=4,
+        hotkey="hotkey",
+        coldkey="coldkey",
+    )
+    return bt.dendrite.preprocess_synapse_for_request(dendrite, axon, synapse)
+
+
+def test_body_hash_is_computed_once_and_shared_by_copies(hashes):
+    synapse = Prompting(roles=["user"], messages=["hi"])
+    body_hash = synapse.body_hash
+    hashed = len(hashes)
+
+    for _ in range(3):
+        signed = sign(synapse.copy())
+        # The signature covers the hash of the original synapse
+        d = signed.dendrite
+        message = f"{d.nonce}.{d.hotkey}.{signed.axon.hotkey}.{d.uuid}.{body_hash}"
+        assert bt.Keypair(ss58_address=d.hotkey).verify(message, d.signature)
+    # Signing the copies did not hash the body again
+    assert len(hashes) == hashed
+    assert synapse.copy().body_hash == body_hash
+
+
+def test_changed_hashed_fields_are_not_served_a_stale_hash():
+    synapse = Prompting(roles=["user"], messages=["hi"])
+    body_hash = synapse.body_hash
+
+    with pytest.raises(TypeError):
+        synapse.messages = ["other"]
+    changed = synapse.copy(update={"messages": ["other"]})
+    assert changed.body_hash != body_hash
+    assert changed.body_hash == Prompting(roles=["user"], messages=["other"]).body_hash
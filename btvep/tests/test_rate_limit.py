@@ -0,0 +1,208 @@
+import asyncio
+from types import SimpleNamespace
+
+import fakeredis
+import pytest
+from fastapi_limiter import FastAPILimiter
+
+from btvep.rate_limit import (
+    LeasedRateLimiter,
+    LocalRateLimiter,
+    RateLimiterCache,
+    RateLimitState,
+    RedisRateLimiter,
+)
+
+
+@pytest.fixture
+def redis(monkeypatch):
+    """A fresh fake Redis with Lua support, used as the FastAPILimiter connection."""
+    redis = fakeredis.FakeAsyncRedis(
+        server=fakeredis.FakeServer(), decode_responses=True
+    )
+    monkeypatch.setattr(FastAPILimiter, "redis", redis)
+    return redis
+
+
+def count_calls(redis):
+    """Counts the scripts run in redis, not the tries before a script is loaded."""
+    calls = []
+    evalsha = redis.evalsha
+
+    async def counting(*args, **kwargs):
+        result = await evalsha(*args, **kwargs)
+        calls.append(args)
+        return result
+
+    redis.evalsha = counting
+    return calls
+
+
+def check_all(limiter, identifier, n):
+    async def run():
+        return [await limiter.check(identifier) for _ in range(n)]
+
+    return asyncio.run(run())
+
+
+def test_limiters_are_rebuilt_when_the_rate_limits_change():
+    builds = []
+
+    def build(api_key):
+        builds.append(api_key.rate_limits)
+        return [api_key.rate_limits]
+
+    cache = RateLimiterCache(build, max_entries=1)
+    key = SimpleNamespace(id=1, rate_limits='[{"times": 1, "seconds": 1}]')
+    limiter = cache.get(key)
+    assert cache.get(key) is limiter
+    assert len(builds) == 1
+
+    key.rate_limits = '[{"times": 2, "seconds": 1}]'
+    assert cache.get(key) == [key.rate_limits]
+    cache.invalidate(1)
+    cache.get(key)
+    cache.get(SimpleNamespace(id=2, rate_limits="[]"))
+    assert list(cache.entries) == [2]
+    assert len(builds) == 4
+
+
+def test_local_limiter_allows_bursts_and_checks_all_windows():
+    now = [0.0]
+    state = RateLimitState()
+    limiter = LocalRateLimiter(
+        [{"times": 3, "seconds": 1}, {"times": 5, "seconds": 60}],
+        callback=None,
+        state=state,
+        clock=lambda: now[0],
+    )
+
+    async def check(n):
+        return [await limiter.check("key") for _ in range(n)]
+
+    assert asyncio.run(check(4)) == [0, 0, 0, 334]
+    # One request per third of a second after the burst
+    now[0] = 1 / 3
+    assert asyncio.run(check(2)) == [0, 334]
+    # Rejected requests are not counted, so the minute window has one left,
+    # then refills one request every 12 seconds
+    now[0] = 2
+    assert asyncio.run(check(2)) == [0, 10000]
+
+    # A rebuilt limiter shares the state of the old one
+    rebuilt = LocalRateLimiter(
+        [{"times": 3, "seconds": 1}, {"times": 5, "seconds": 60}],
+        callback=None,
+        state=state,
+        clock=lambda: now[0],
+    )
+    assert asyncio.run(rebuilt.check("key")) == 10000
+    assert asyncio.run(rebuilt.check("other")) == 0
+
+
+def test_redis_limiter_does_not_count_rejected_requests(redis):
+    limiter = RedisRateLimiter(
+        [{"times": 3, "seconds": 1}, {"times": 5, "seconds": 60}], callback=None
+    )
+    results = check_all(limiter, "key", 4)
+    assert results[:3] == [0, 0, 0]
+    assert 0 < results[3] <= 1000
+
+    async def counters():
+        return [await redis.get(key) for key in limiter.keys("key")]
+
+    # The request rejected by the second window was not counted in the minute window
+    assert asyncio.run(counters()) == ["3", "3"]
+
+
+def test_redis_limiter_waits_for_every_full_window(redis):
+    limiter = RedisRateLimiter(
+        [{"times": 1, "seconds": 1}, {"times": 1, "seconds": 60}], callback=None
+    )
+    results = check_all(limiter, "key", 2)
+    # Both windows are full, the retry-after is the one of the minute window
+    assert results[0] == 0
+    assert 59_000 < results[1] <= 60_000
+
+    # Only the second window is full
+    limiter = RedisRateLimiter(
+        [{"times": 1, "seconds": 1}, {"times": 5, "seconds": 60}], callback=None
+    )
+    results = check_all(limiter, "other", 2)
+    assert results[0] == 0
+    assert 0 < results[1] <= 1000
+
+
+def test_redis_limiter_with_limit_zero_rejects_everything(redis):
+    limiter = RedisRateLimiter(
+        [{"times": 0, "seconds": 5}, {"times": 5, "seconds": 60}], callback=None
+    )
+    assert check_all(limiter, "key", 2) == [5000, 5000]
+
+    async def counters():
+        return [await redis.get(key) for key in limiter.keys("key")]
+
+    assert asyncio.run(counters()) == [None, None]
+
+
+def test_leased_limiter_holds_the_limits_across_workers(redis):
+    calls = count_calls(redis)
+    limits = [{"times": 25, "seconds": 60}, {"times": 100, "seconds": 3600}]
+    workers = [
+        LeasedRateLimiter(limits, callback=None, state=RateLimitState(), lease_size=10)
+        for _ in range(2)
+    ]
+
+    async def run():
+        return [await workers[i % 2].check("key") for i in range(30)]
+
+    results = asyncio.run(run())
+    assert sum(result == 0 for result in results) == 25
+    assert all(0 < result <= 60_000 for result in results if result != 0)
+    # 10 + 10 + 5 requests leased, then the second worker learns that the key
+    # is blocked and stops asking
+    assert len(calls) == 4
+
+
+def test_leased_limiter_does_not_ask_redis_while_blocked(redis):
+    calls = count_calls(redis)
+    now = 1000.0
+    limiter = LeasedRateLimiter(
+        [{"times": 2, "seconds": 60}],
+        callback=None,
+        state=RateLimitState(),
+        clock=lambda: now,
+    )
+    results = check_all(limiter, "key", 5)
+    assert results[:2] == [0, 0]
+    assert all(result > 0 for result in results[2:])
+    # One lease and one rejection, the other requests are rejected locally
+    assert len(calls) == 2
+
+    now += 61
+    check_all(limiter, "key", 1)
+    assert len(calls) == 3
+
+
+def test_leased_limiter_renews_expired_leases(redis):
+    calls = count_calls(redis)
+    now = 1000.0
+    limiter = LeasedRateLimiter(
+        [{"times": 10, "seconds": 60}],
+        callback=None,
+        state=RateLimitState(),
+        lease_size=4,
+        clock=lambda: now,
+    )
+    assert check_all(limiter, "key", 2) == [0, 0]
+    assert len(calls) == 1
+
+    # The lease ended with its window, the 2 requests left in it are not used
+    now += 61
+    assert check_all(limiter, "key", 1) == [0]
+    assert len(calls) == 2
+
+    async def counter():
+        return await redis.get(limiter.keys("key")[0])
+
+    assert asyncio.run(counter()) == "8"
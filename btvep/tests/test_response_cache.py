@@ -0,0 +1,88 @@
+import asyncio
+
+import pytest
+
+from btvep.constants import COST
+from btvep.db import api_keys
+from btvep.db.request import Request
+from btvep.response_cache import MemoryResponseCache, RedisResponseCache
+
+
+@pytest.fixture
+def response_cache(monkeypatch):
+    cache = MemoryResponseCache(ttl_seconds=60, max_entries=100, max_bytes=100_000)
+    monkeypatch.setattr("btvep.api.chat.response_cache", cache)
+    return cache
+
+
+def test_identical_requests_are_served_from_the_cache(
+    client, api_key, prompter, response_cache
+):
+    body = {"messages": [{"role": "user", "content": "hi"}], "uids": [1]}
+    response = client.post("/chat", json=body)
+    assert response.status_code == 200
+    assert not response.json()["cached"]
+
+    # Same request, with its JSON keys in another order
+    reordered = {"uids": [1], "messages": [{"content": "hi", "role": "user"}]}
+    cached = client.post("/chat", json=reordered)
+    assert cached.json() == {**response.json(), "cached": True}
+    assert len(prompter.dendrite.started) == 1
+
+    # A hit is still logged and charged, but sends no request to the network
+    logged = list(Request.select().order_by(Request.id))
+    assert [row.return_message for row in logged] == [None, "Cached response"]
+    key = api_keys.get("test-key")
+    assert key.api_request_count == 2
+    assert key.request_count == 1
+    assert key.credits == 100 - 2 * COST
+
+    # Other messages or another query strategy are different entries
+    client.post("/chat", json={**body, "uids": [2]})
+    client.post("/chat", json={**body, "messages": [{"role": "user", "content": "x"}]})
+    assert len(prompter.dendrite.started) == 3
+
+
+def test_keys_can_opt_out_of_the_cache(client, api_key, prompter, response_cache):
+    api_keys.update(api_key.id, response_cache_enabled=False)
+    body = {"messages": [{"role": "user", "content": "hi"}], "uids": [1]}
+    assert not client.post("/chat", json=body).json()["cached"]
+    assert not client.post("/chat", json=body).json()["cached"]
+    assert len(prompter.dendrite.started) == 2
+    assert len(response_cache.entries) == 0
+
+
+def test_memory_cache_expires_and_evicts_entries():
+    now = 0
+    cache = MemoryResponseCache(ttl_seconds=10, max_entries=100, max_bytes=60)
+    cache.entries.clock = lambda: now
+
+    async def run():
+        await cache.set("a", {"choices": "a" * 10})
+        await cache.set("b", {"choices": "b" * 10})
+        # Over max_bytes, the least recently used entry is dropped
+        assert await cache.get("a") is not None
+        await cache.set("c", {"choices": "c" * 10})
+        assert await cache.get("b") is None
+        assert await cache.get("a") is not None
+        # Responses larger than the whole cache are not stored
+        await cache.set("d", {"choices": "d" * 60})
+        assert await cache.get("d") is None
+
+        nonlocal now
+        now = 10
+        assert await cache.get("a") is None
+        assert await cache.get("c") is None
+
+    asyncio.run(run())
+
+
+def test_redis_errors_are_cache_misses():
+    # Nothing listens on port 1
+    cache = RedisResponseCache("redis://127.0.0.1:1", ttl_seconds=60)
+
+    async def run():
+        await cache.set("a", {"choices": []})
+        return await cache.get("a")
+
+    assert asyncio.run(run()) is None
@@ -0,0 +1,22 @@
+from btvep.scoreboard import UidScoreboard
+
+
+def test_rank_prefers_fast_successful_uids():
+    scoreboard = UidScoreboard()
+    scoreboard.record(1, elapsed=0.5, is_success=True)
+    scoreboard.record(2, elapsed=5.0, is_success=True)
+    scoreboard.record(3, elapsed=0.1, is_success=False)
+
+    # 4 was never queried and keeps its position among ties
+    assert scoreboard.rank([4, 3, 2, 1]) == [1, 2, 4, 3]
+
+
+def test_p90_latency():
+    scoreboard = UidScoreboard()
+    assert scoreboard.p90_latency() is None
+    for i in range(1, 11):
+        scoreboard.record(1, elapsed=float(i), is_success=True)
+    # Failed responses do not count towards the latency percentiles
+    scoreboard.record(1, elapsed=12.0, is_success=False)
+    assert scoreboard.p90_latency() == 10.0
+    assert scoreboard.p90_latency([2]) is None
@@ -0,0 +1,62 @@
+import asyncio
+
+import httpx
+
+from btvep.constants import COST
+from btvep.db import api_keys
+from btvep.db.request import Request
+
+BODY = {"messages": [{"role": "user", "content": "hi"}], "uids": [0, 1]}
+
+
+def async_client(app):
+    return httpx.AsyncClient(
+        transport=httpx.ASGITransport(app=app),
+        base_url="http://testserver",
+        headers={"Authorization": "Bearer test-key"},
+    )
+
+
+def test_identical_concurrent_requests_share_one_query(app, api_key, prompter):
+    prompter.dendrite.delays = {0: 0.1, 1: 0.1}
+
+    async def run():
+        async with async_client(app) as client:
+            return await asyncio.gather(
+                *[client.post("/chat", json=BODY) for _ in range(5)]
+            )
+
+    responses = asyncio.run(run())
+
+    assert [uid for uid, _ in prompter.dendrite.started] == [0, 1]
+    assert all(response.status_code == 200 for response in responses)
+    assert len({response.text for response in responses}) == 1
+    # Every request is logged and charged on its own
+    assert Request.select().count() == 5
+    key = api_keys.get("test-key")
+    assert key.api_request_count == 5
+    assert key.credits == 100 - 5 * COST
+
+
+def test_a_cancelled_caller_does_not_cancel_the_shared_query(app, api_key, prompter):
+    prompter.dendrite.delays = {0: 0.1, 1: 0.1}
+
+    async def run():
+        async with async_client(app) as client:
+            leader = asyncio.create_task(client.post("/chat", json=BODY))
+            await asyncio.sleep(0.02)
+            followers = [
+                asyncio.create_task(client.post("/chat", json=BODY)) for _ in range(2)
+            ]
+            await asyncio.sleep(0.02)
+            # The caller that started the query goes away
+            leader.cancel()
+            return await asyncio.gather(*followers)
+
+    responses = asyncio.run(run())
+
+    assert prompter.dendrite.cancelled == []
+    assert [uid for uid, _ in prompter.dendrite.started] == [0, 1]
+    assert all(response.status_code == 200 for response in responses)
+    assert all(response.json()["choices"] for response in responses)
+    assert api_keys.get("test-key").api_request_count == 2
@@ -0,0 +1,38 @@
+from btvep.ttl_cache import TTLCache
+
+
+def test_entries_expire_and_least_recently_used_are_evicted():
+    now = 0
+    removed = []
+    cache = TTLCache(
+        2, ttl_seconds=10, clock=lambda: now, on_remove=lambda *e: removed.append(e)
+    )
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1
+    cache.set("c", 3)
+    assert list(cache) == ["a", "c"]
+    assert cache.get("b", "missing") == "missing"
+
+    # An entry can expire before the TTL, but not after it
+    cache.set("d", 4, expires_at=5)
+    cache.set("a", 5, expires_at=60)
+    now = 5
+    assert cache.get("d") is None
+    assert cache.get("a") == 5
+    now = 10
+    assert cache.get("a") is None
+    assert removed == [("b", 2), ("a", 1), ("c", 3), ("d", 4), ("a", 5)]
+
+
+def test_entries_are_evicted_by_size():
+    cache = TTLCache(10, max_size=10)
+    cache.set("a", "12345")
+    cache.set("b", "1234")
+    cache.set("c", "12")
+    assert list(cache) == ["b", "c"]
+    assert cache.total_size == 6
+    cache.set("b", "1")
+    assert cache.total_size == 3
+    cache.pop("c")
+    assert cache.total_size == 1
@@ -0,0 +1,148 @@
+import asyncio
+
+from btvep.btvep_models import Message
+from btvep.circuit_breaker import BreakerState
+
+from .fakes import FakeDendrite, fake_prompter
+
+
+def query(prompter, **kwargs):
+    """Runs query_network, returns the uids that answered and when."""
+
+    async def run():
+        prompter.dendrite.started_at = asyncio.get_running_loop().time()
+        results = []
+        stream = prompter.query_network_stream(
+            [Message(role="user", content="hi")], **kwargs
+        )
+        async for result in stream:
+            results.append((result["uid"], prompter.dendrite.elapsed()))
+        return results
+
+    return asyncio.run(run())
+
+
+def test_hedged_query_starts_a_backup_after_the_hedge_delay():
+    dendrite = FakeDendrite({0: 0.5, 1: 0.05, 2: 0.05})
+    prompter = fake_prompter(dendrite)
+
+    results = query(prompter, uids=[0, 1, 2], hedge=True, hedge_delay=0.1)
+
+    # uid 1 is only queried once uid 0 has not answered within the hedge delay
+    assert [uid for uid, _ in dendrite.started] == [0, 1]
+    assert 0.09 < dendrite.started[1][1] < 0.2
+    assert [uid for uid, _ in results] == [1]
+    # The slower query lost and was cancelled, uid 2 was never needed
+    assert dendrite.cancelled == [0]
+    assert dendrite.in_flight == 0
+    assert prompter.abandoned_queries == 1
+    assert [c["uid"] for c in prompter.recent_cancellations] == [0]
+
+
+def test_hedged_query_starts_a_backup_right_after_a_failure():
+    dendrite = FakeDendrite({0: 0.02, 1: 0.02}, failing=[0])
+    prompter = fake_prompter(dendrite)
+
+    results = query(prompter, uids=[0, 1], hedge=True, hedge_delay=1)
+
+    assert [uid for uid, _ in results] == [0, 1]
+    # The backup did not wait for the hedge delay
+    assert dendrite.started[1][1] < 0.2
+    assert prompter.abandoned_queries == 0
+
+
+def test_hedged_query_stops_starting_backups_at_the_deadline():
+    dendrite = FakeDendrite({uid: 1 for uid in range(8)})
+    prompter = fake_prompter(dendrite)
+
+    results = query(
+        prompter, uids=list(range(8)), hedge=True, hedge_delay=0.1, timeout=0.25
+    )
+
+    # Backups at 0.1 and 0.2 seconds, none after the timeout of 0.25 seconds
+    assert [uid for uid, _ in dendrite.started] == [0, 1, 2]
+    # Every query timed out and was waited for. Backups only got the time left,
+    # so all of them ended at the timeout
+    assert sorted(uid for uid, _ in results) == [0, 1, 2]
+    assert dendrite.cancelled == []
+    assert all(0.2 < elapsed < 0.3 for _, elapsed in results)
+
+
+def test_hedge_delay_defaults_to_the_p90_latency_of_the_uids():
+    dendrite = FakeDendrite({0: 0.5, 1: 0.05})
+    prompter = fake_prompter(dendrite)
+    prompter.scoreboard.record(0, elapsed=0.1, is_success=True)
+    prompter.scoreboard.record(1, elapsed=0.1, is_success=True)
+    # A slow uid that is not queried does not delay the backup
+    prompter.scoreboard.record(7, elapsed=10, is_success=True)
+
+    results = query(prompter, uids=[0, 1], hedge=True)
+
+    assert [uid for uid, _ in results] == [1]
+    assert dendrite.started[1][1] < 0.2
+
+
+def test_losing_queries_are_cancelled_and_awaited():
+    dendrite = FakeDendrite({0: 0.05, 1: 1, 2: 1})
+    prompter = fake_prompter(dendrite)
+    # uid 1 is queried as the single probe of a half open circuit breaker
+    prompter.circuit_breakers.open_seconds = 0
+    prompter.circuit_breakers.record(1, "hotkey-1", is_success=False)
+    prompter.circuit_breakers.record(1, "hotkey-1", is_success=False)
+    prompter.circuit_breakers.record(1, "hotkey-1", is_success=False)
+
+    async def run():
+        dendrite.started_at = asyncio.get_running_loop().time()
+        results = await prompter.query_network(
+            [Message(role="user", content="hi")], uids=[0, 1, 2]
+        )
+        # Nothing is left running once the request is done
+        return results, dendrite.in_flight
+
+    results, in_flight = asyncio.run(run())
+    assert [result["uid"] for result in results] == [0]
+    assert in_flight == 0
+    assert sorted(dendrite.cancelled) == [1, 2]
+    assert prompter.abandoned_queries == 2
+    assert sorted(c["uid"] for c in prompter.recent_cancellations) == [1, 2]
+    assert all(c["elapsed"] < 0.5 for c in prompter.recent_cancellations)
+    # The cancelled probe gave no verdict, the next query may probe again
+    assert prompter.circuit_breakers.breakers[1].state == BreakerState.HALF_OPEN
+    assert not prompter.circuit_breakers.breakers[1].probe_in_flight
+    assert prompter.circuit_breakers.allow(1, "hotkey-1")
+
+
+def test_in_parallel_keeps_a_sliding_window_of_queries_in_flight():
+    # Different delays, so queries finish one at a time
+    dendrite = FakeDendrite({uid: 0.05 * (1 + uid % 3) for uid in range(8)})
+    prompter = fake_prompter(dendrite)
+
+    results = query(
+        prompter, uids=list(range(8)), in_parallel=3, respond_on_first_success=False
+    )
+
+    assert sorted(uid for uid, _ in results) == list(range(8))
+    assert dendrite.max_in_flight == 3
+    # The next uid starts as soon as any query is done, not once all 3 are done
+    assert [uid for uid, _ in dendrite.started[:4]] == [0, 1, 2, 3]
+    assert dendrite.started[3][1] < 0.1
+
+
+def test_a_query_keeps_the_index_it_started_with():
+    dendrite = FakeDendrite({0: 0.05, 1: 0.05}, failing=[0])
+    prompter = fake_prompter(dendrite)
+
+    async def run():
+        stream = prompter.query_network_stream(
+            [Message(role="user", content="hi")], uids=[0, 1], in_parallel=1
+        )
+        results = [await stream.__anext__()]
+        # A resync that drops uid 1 while the query is running
+        prompter.metagraph_syncer = fake_prompter(dendrite, n=1).metagraph_syncer
+        results.extend([result async for result in stream])
+        return results
+
+    results = asyncio.run(run())
+
+    assert [result["uid"] for result in results] == [0, 1]
+    assert results[1]["dendrite_response"].dest_hotkey == "hotkey-1"